@@ -1,27 +1,45 @@
-from expr import Expr, Unary, Binary, Literal, Grouping, ExprVisitor
+from expr import Expr, Unary, Binary, Literal, Grouping
 
 
-class AstPrinter(ExprVisitor):
-    def parenthesize(self, name: str, exprs: list[Expr]) -> str:
-        s = ["(", name]
-        for expr in exprs:
-            s.append(" ")
-            s.append(self.visit(expr))
-        s.append(")")
+class AstPrinter:
+    """Print an expression in LISP style.
+    There are only four kinds of nodes here, so we branch on the type directly
+    """
 
-        return "".join(s)
-
-    def visit_Binary(self, expr: Binary):
-        return self.parenthesize(expr.operator.lexeme, [expr.left, expr.right])
+    def parenthesize(self, name: str, exprs: list[Expr], stack: list[Expr | str]):
+        """Schedule "(name expr ...)" on the work stack, so push it in reverse order"""
+        push = stack.append
+        push(")")
+        for expr in reversed(exprs):
+            push(expr)
+            push(" ")
+        push(name)
+        push("(")
 
-    def visit_Grouping(self, expr: Grouping):
-        return self.parenthesize("group", [expr.expression])
+    def print(self, expr: Expr) -> str:
+        # walk the tree with a stack of pending nodes/strings instead of recursion
+        # , so a long chain of operators doesn't cost a Python call per node
+        s: list[str] = []
+        append = s.append
+        stack: list[Expr | str] = [expr]
+        pop = stack.pop
+        while stack:
+            item = pop()
+            t = type(item)
+            if t is str:
+                append(item)
+            elif t is Binary:
+                self.parenthesize(item.operator.lexeme, [item.left, item.right], stack)
+            elif t is Literal:
+                # a literal never changes, so format it only once
+                if item._repr is None:
+                    item._repr = "nil" if item.value is None else str(item.value)
+                append(item._repr)
+            elif t is Unary:
+                self.parenthesize(item.operator.lexeme, [item.right], stack)
+            elif t is Grouping:
+                self.parenthesize("group", [item.expression], stack)
+            else:
+                raise RuntimeError(f"No {t.__name__} method")
 
-    def visit_Literal(self, expr: Literal) -> str:
-        if expr.value is None:
-            return "nil"
-        
-        return str(expr.value)
-
-    def visit_Unary(self, expr: Unary):
-        return self.parenthesize(expr.operator.lexeme, [expr.right])
+        return "".join(s)
@@ -3,60 +3,84 @@ from tokens import Token
 from errors import InterpreterError
 
 
+def _undefined_variable(name: Token) -> InterpreterError:
+    """Only build the error message when a lookup actually fails"""
+    return InterpreterError(name, f"Undefined variable '{name.lexeme}'.")
+
+
 class Environment:
-    def __init__(self, env=None):
-        # global env has no enclosing env
+    # a new env is created for every block and call, so keep it small
+    __slots__ = ("values", "slots", "enclosing", "ancestor_slots")
+
+    def __init__(
+        self, env: "Environment | None" = None, slots: list[Any] | None = None
+    ):
+        # global env has no enclosing env, and it is the only env keyed by names
         self.values: dict[str, Any] = {}
+        # local envs store variables in the slots assigned by the resolver
+        self.slots: list[Any] = slots if slots is not None else []
+        self.enclosing: Environment | None = env
+        # the slots of this env and all its enclosing envs, i.e. indexed by distance
+        self.ancestor_slots: list[list[Any]] = (
+            [self.slots] + env.ancestor_slots if env else [self.slots]
+        )
+
+    def reset(self, env: "Environment") -> None:
+        """Nest this released env in env, as if it had just been created"""
         self.enclosing = env
+        # release() left only this env's own slots in the list
+        self.ancestor_slots.extend(env.ancestor_slots)
+
+    def release(self) -> None:
+        """Empty this env and unlink it from its enclosing envs before it is reused
+        , so it doesn't keep their values alive while it waits
+        """
+        self.slots.clear()
+        self.enclosing = None
+        del self.ancestor_slots[1:]
 
     def __repr__(self):
         lines = ["----- This environment: -----"]
         for name, val in self.values.items():
             lines.append(f"  {name}: {val}")
+        for slot, val in enumerate(self.slots):
+            lines.append(f"  #{slot}: {val}")
         lines.append("-----------------------------")
 
         return "\n".join(lines)
 
-    def define(self, name: str, value: Any):
+    def define(self, name: str, value: Any) -> None:
         """A variable definition binds a new name to a value"""
-        self.values[name] = value
+        if self.enclosing is None:
+            self.values[name] = value
+        else:
+            # the resolver numbers local variables in the order they are declared
+            self.slots.append(value)
 
-    def assign(self, name: Token, value: Any):
+    def assign(self, name: Token, value: Any) -> None:
         """Assignment is not allowed to create a new variable"""
-        if name.lexeme in self.values:
-            self.values[name.lexeme] = value
-            return
-        if self.enclosing:
-            self.enclosing.assign(name, value)
-            return
+        # locals are resolved to slots, so a name is always looked up in the global env
+        lexeme = name.lexeme
+        values = self.values
+        if lexeme not in values:
+            raise _undefined_variable(name)
+        values[lexeme] = value
 
-        raise InterpreterError(name, f"Undefined variable '{name.lexeme}'.")
-
-    def get(self, name: Token):
-        if name.lexeme in self.values:
+    def get(self, name: Token) -> Any:
+        # locals are resolved to slots, so a name is always looked up in the global env
+        try:
             return self.values[name.lexeme]
-        # walk the env chain
-        if self.enclosing:
-            return self.enclosing.get(name)
-
-        raise InterpreterError(name, f"Undefined variable '{name.lexeme}'.")
-
-    def get_at(self, distance: int, name: str):
-        return self.ancestor(distance).values.get(name)
-
-    def ancestor(self, distance: int):
-        """Walks a fixed number of hoops up the parent chain and returns the env there"""
-        res = self
-        for i in range(distance):
-            res = res.enclosing
+        except KeyError:
+            raise _undefined_variable(name)
 
-        return res
+    def get_at(self, distance: int, slot: int) -> Any:
+        return self.ancestor_slots[distance][slot]
 
-    def assign_at(self, distance: int, name: Token, value: Any):
-        self.ancestor(distance).values[name.lexeme] = value
+    def assign_at(self, distance: int, slot: int, value: Any) -> None:
+        self.ancestor_slots[distance][slot] = value
 
-    def helper_env_chain(self):
-        cursor = self
+    def helper_env_chain(self) -> None:
+        cursor: Environment | None = self
         while cursor:
             print(cursor)
             cursor = cursor.enclosing
@@ -1,13 +1,14 @@
 from tokens import Token, TokenType
 
 
-def error_report(token: Token, msg: str, show_line_number: bool = True):
-    if token.type == TokenType.EOF:
+def format_error(token: Token, msg: str, show_line_number: bool = True) -> str:
+    """The message of a static error, the caller decides when to print it"""
+    if token.type is TokenType.EOF:
         err = f"Error at end: {msg}"
     else:
         err = f"Error at '{token.lexeme}': {msg}"
 
-    print(f"[line {token.line}] " + err if show_line_number else err)
+    return f"[line {token.line}] " + err if show_line_number else err
 
 
 class ParseError(Exception):
@@ -16,7 +17,7 @@ class ParseError(Exception):
         self.msg = msg
 
     def __str__(self):
-        if self.token.type == TokenType.EOF:
+        if self.token.type is TokenType.EOF:
             return f"[line {self.token.line}] Error at end: {self.msg}"
         else:
             return (
@@ -33,6 +34,15 @@ class InterpreterError(Exception):
         return f"Error at '{self.token}': {self.msg}"
 
 
-class ReturnException(Exception):
-    def __init__(self, value):
-        self.value = value
+class Returning:
+    """Returned (not raised) by a return statement.
+    Statements produce None, so RETURNING tells the enclosing blocks and loops
+    to stop and hand it up to the function call, which then picks the returned
+    value up from the interpreter
+    """
+
+    __slots__ = ()
+
+
+# the only instance, so a return statement allocates nothing
+RETURNING = Returning()
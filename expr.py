@@ -1,68 +1,147 @@
-from typing import Any, TYPE_CHECKING
+from typing import Any, Callable, TYPE_CHECKING
 from tokens import Token
 from environment import Environment
-from errors import ReturnException, InterpreterError
+from errors import InterpreterError
 
 if TYPE_CHECKING:
     from interpreter import Interpreter
 
 
+class Node:
+    """The base class of all AST nodes"""
+
+    __slots__ = ()
+
+    # the name of the visitor method for this node, e.g. "visit_Binary"
+    _visit_attr: str
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._visit_attr = f"visit_{cls.__name__}"
+
+
 # Expressions
-class Expr:
-    ...
+class Expr(Node):
+    __slots__ = ()
 
 
 class Unary(Expr):
+    __slots__ = ("operator", "right", "op_type")
+
     def __init__(self, operator: Token, right: Expr):
         self.operator = operator
         self.right = right
+        # tokens never change, so remember the operator's type up front
+        self.op_type = operator.type
 
 
 class Binary(Expr):
+    __slots__ = ("left", "operator", "right", "op_type")
+
     def __init__(self, left: Expr, operator: Token, right: Expr):
         self.left = left
         self.operator = operator
         self.right = right
+        # tokens never change, so remember the operator's type up front
+        self.op_type = operator.type
+
+
+class BinaryWithNumber(Binary):
+    """A Binary whose right operand is a number literal, e.g. `i < 10` or `i + 1`.
+    The optimizer fuses the two nodes, so the literal isn't visited on every evaluation
+    """
+
+    __slots__ = ("number",)
+
+    def __init__(self, left: Expr, operator: Token, right: "Literal"):
+        super().__init__(left, operator, right)
+        self.number: float = right.value
 
 
 class Literal(Expr):
+    __slots__ = ("value", "_repr")
+
     def __init__(self, value: Any):
         self.value = value
+        # the printed form of the value, filled by AstPrinter on demand
+        self._repr: str | None = None
 
 
 class Grouping(Expr):
+    __slots__ = ("expression",)
+
     def __init__(self, expression: Expr):
         self.expression = expression
 
 
 class Variable(Expr):
+    __slots__ = ("name", "distance", "slot")
+
     def __init__(self, name: Token):
         self.name = name
+        # filled in by the resolver, a global variable keeps distance None
+        self.distance: int | None = None
+        self.slot = 0
 
 
 class Assign(Expr):
+    __slots__ = ("name", "value", "distance", "slot")
+
     def __init__(self, name: Token, value: Expr):
         self.name = name
         self.value = value
+        # filled in by the resolver, a global variable keeps distance None
+        self.distance: int | None = None
+        self.slot = 0
 
 
 class Logical(Expr):
+    __slots__ = ("left", "operator", "right", "op_type")
+
     def __init__(self, left: Expr, operator: Token, right: Expr):
         self.left = left
         self.operator = operator
         self.right = right
+        # tokens never change, so remember the operator's type up front
+        self.op_type = operator.type
 
 
 class Call(Expr):
+    __slots__ = (
+        "callee",
+        "paren",
+        "arguments",
+        "_callee_type",
+        "_is_lox_callable",
+        "_cached_callee",
+    )
+
     def __init__(self, callee: Expr, paren: Token, arguments: list[Expr]):
         self.callee = callee
         self.paren = paren
         self.arguments = arguments
+        # the type of the last callee seen here, and whether it's a Lox callable
+        self._callee_type: type | None = None
+        self._is_lox_callable = False
+        # the Lox function this call site is specialized for, see CallFunction
+        self._cached_callee: "Function | None" = None
+
+
+class CallFunction(Call):
+    """A Call to a global Lox function that has already been called once and passed
+    the checks. The interpreter switches the node's class in place, and back to Call
+    when the callee turns out to be another object
+    """
+
+    # no new slots, so the layout matches Call and __class__ can be swapped
+    __slots__ = ()
 
 
 class Get(Expr):
     """For property access in OOP"""
 
+    __slots__ = ("obj", "name")
+
     def __init__(self, obj: Expr, name: Token):
         self.obj = obj
         self.name = name
@@ -71,6 +150,8 @@ class Get(Expr):
 class Set(Expr):
     """For setter in OOP"""
 
+    __slots__ = ("obj", "name", "value")
+
     def __init__(self, obj: Expr, name: Token, value: Expr):
         self.obj = obj
         self.name = name
@@ -80,45 +161,72 @@ class Set(Expr):
 class This(Expr):
     """`this` is a keyword used in OOP"""
 
+    __slots__ = ("keyword", "distance", "slot")
+
     def __init__(self, keyword: Token):
         self.keyword = keyword
+        # filled in by the resolver, a global variable keeps distance None
+        self.distance: int | None = None
+        self.slot = 0
 
 
 class Super(Expr):
     """`super` is a keyword used in OOP"""
 
+    __slots__ = ("keyword", "method", "distance", "slot")
+
     def __init__(self, keyword: Token, method: Token):
         self.keyword = keyword
         self.method = method
+        # filled in by the resolver, a global variable keeps distance None
+        self.distance: int | None = None
+        self.slot = 0
 
 
 # Statements
-class Stmt:
-    ...
+class Stmt(Node):
+    __slots__ = ()
 
 
 class Expression(Stmt):
+    __slots__ = ("expression",)
+
     def __init__(self, expr: Expr):
         self.expression = expr
 
 
 class Print(Stmt):
+    __slots__ = ("expression",)
+
     def __init__(self, expr: Expr):
         self.expression = expr
 
 
 class Var(Stmt):
+    __slots__ = ("name", "initializer")
+
     def __init__(self, name: Token, initializer: Expr | None):
         self.name = name
         self.initializer = initializer
 
 
 class Block(Stmt):
+    __slots__ = ("statements", "has_scope", "captured", "free_envs")
+
     def __init__(self, statements: list[Stmt]):
         self.statements = statements
+        # the resolver clears this if the block declares nothing of its own
+        self.has_scope = True
+        # the resolver clears this if no function or class is declared inside
+        # , i.e. no closure can keep the block's env alive after it exits
+        self.captured = True
+        # the envs of finished runs of an uncaptured block, ready for reuse
+        self.free_envs: list[Environment] = []
 
 
 class IfStmt(Stmt):
+    __slots__ = ("condition", "then_branch", "else_branch")
+
     def __init__(self, condition: Expr, then_branch: Stmt, else_branch: Stmt | None):
         self.condition = condition
         self.then_branch = then_branch
@@ -126,12 +234,25 @@ class IfStmt(Stmt):
 
 
 class WhileStmt(Stmt):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition: Expr, body: Stmt):
         self.condition = condition
         self.body = body
 
 
 class Function(Stmt):
+    __slots__ = (
+        "name",
+        "params",
+        "body",
+        "arity",
+        "closure",
+        "is_initializer",
+        "_single_stmt",
+        "_returns_expr",
+    )
+
     def __init__(
         self,
         name: Token,
@@ -146,46 +267,97 @@ class Function(Stmt):
         self.arity = len(self.params)
         self.closure = closure
         self.is_initializer = is_initializer
-
-    def __call__(self, interpreter: "Interpreter", arguments: list[Any]):
-        env = Environment(self.closure)
-        for i, param in enumerate(self.params):
-            env.define(param.lexeme, arguments[i])
-        # unwind all the way to where the function call began
-        try:
-            interpreter.execute_block(self.body.statements, env)
-        except ReturnException as e:
-            # if this function is an initializer, we forcibly return "this"
-            if self.is_initializer and self.closure is not None:
-                return self.closure.get_at(0, "this")
-            return e.value
+        # many small functions have only one statement, e.g. `return a + b;`
+        self._single_stmt = body.statements[0] if len(body.statements) == 1 else None
+        # and the body of many of them is just `return <expr>;`
+        self._returns_expr = (
+            type(self._single_stmt) is ReturnStmt
+            and self._single_stmt.value is not None
+        )
+
+    def __call__(self, interpreter: "Interpreter", arguments: list[Any] | tuple[()]):
+        # the resolver puts the parameters in slots 0..arity-1
+        env = Environment(self.closure, list(arguments))
+        if self._returns_expr:
+            # evaluate the returned expression directly, no return statement needed
+            # , an initializer can't return a value, so it never gets here
+            expr = self._single_stmt.value
+            previous = interpreter.environment
+            try:
+                interpreter.environment = env
+                return interpreter._dispatch[type(expr)](expr)
+            finally:
+                interpreter.environment = previous
+        # a return statement hands its value all the way up to here
+        if self._single_stmt is not None:
+            # skip the loop in execute_block for a single statement
+            previous = interpreter.environment
+            try:
+                interpreter.environment = env
+                returned = interpreter._evaluate(self._single_stmt)
+            finally:
+                interpreter.environment = previous
+        else:
+            returned = interpreter.execute_block(self.body.statements, env)
         # if this function is an initializer, we forcibly return "this"
+        # , which is the only variable (slot 0) in the env created by bind()
         if self.is_initializer and self.closure is not None:
-            return self.closure.get_at(0, "this")
-        return None
+            return self.closure.get_at(0, 0)
+        if returned is None:
+            return None
+        value = interpreter._return_value
+        interpreter._return_value = None
+
+        return value
+
+    def with_closure(self, closure: Environment) -> "Function":
+        """The same function closing over another env. The body was already looked at
+        in __init__, so copy what was found rather than looking at it again
+        """
+        function = Function.__new__(Function)
+        function.name = self.name
+        function.params = self.params
+        function.body = self.body
+        function.arity = self.arity
+        function.closure = closure
+        function.is_initializer = self.is_initializer
+        function._single_stmt = self._single_stmt
+        function._returns_expr = self._returns_expr
+
+        return function
 
     def bind(self, instance: "Instance"):
-        """Create a new env nested inside the method's original closure.
+        """Use an env nested inside the method's original closure which contains "this".
         When the method is called, that will become the parent of the method body's env
         """
-        env = Environment(self.closure)
-        env.define("this", instance)
+        env = instance.this_env(self.closure)
 
         # i.e. we insert a special scope which contains "this"
         # and we only need to change the closure of original's method
-        return Function(self.name, self.params, self.body, env, self.is_initializer)
+        return self.with_closure(env)
 
     def __str__(self):
         return f"<fn {self.name.lexeme}>"
 
 
 class ReturnStmt(Stmt):
+    __slots__ = ("keyword", "value")
+
     def __init__(self, keyword: Token, value: Expr | None):
         self.keyword = keyword
         self.value = value
 
 
 class Class(Stmt):
+    __slots__ = (
+        "name",
+        "methods",
+        "superclass",
+        "_superclass",
+        "_all_methods",
+        "arity",
+    )
+
     def __init__(
         self, name: Token, superclass: Variable | None, methods: list[Function]
     ):
@@ -196,9 +368,21 @@ class Class(Stmt):
         # use a dict to store all methods, { method_name: method }
         for method in methods:
             self.methods[method.name.lexeme] = method
+        # all the methods including the inherited ones, { method_name: method }
+        self._all_methods: dict[str, Function] = self.methods
         # initiate the arity
         self.update_arity()
 
+    def update_methods(self):
+        """Flatten the methods of the superclass chain into a single dict.
+        Like update_arity, this can only be done after _superclass is set
+        """
+        if self._superclass:
+            self._all_methods = {**self._superclass._all_methods, **self.methods}
+        else:
+            self._all_methods = self.methods
+        self.update_arity()
+
     def update_arity(self):
         # WARNING: the __init__(...) will be executed in the definition time.
         # i.e. Parser's _class_declaration method
@@ -210,19 +394,12 @@ class Class(Stmt):
         self.arity = 0 if not initializer else initializer.arity
 
     def find_method(self, name: str) -> Function | None:
-        m = self.methods.get(name, None)
-        if m:
-            return m
-
-        if self._superclass:
-            return self._superclass.find_method(name)
-
-        return None
+        return self._all_methods.get(name, None)
 
     def __repr__(self):
         return self.name.lexeme
 
-    def __call__(self, interpreter: "Interpreter", arguments: list[Any]):
+    def __call__(self, interpreter: "Interpreter", arguments: list[Any] | tuple[()]):
         instance = Instance(self)
         # after creating the instance, we want to find an "init" method
         initializer = self.find_method("init")
@@ -233,9 +410,29 @@ class Class(Stmt):
 
 
 class Instance:
+    __slots__ = ("kclass", "fields", "_this_envs")
+
     def __init__(self, klass: Class):
         self.kclass = klass
         self.fields: dict[str, Any] = {}
+        # { method's closure: env which binds "this" to this instance }
+        self._this_envs: dict[Environment | None, Environment] = {}
+
+    def this_env(self, closure: Environment | None) -> Environment:
+        """Return the env binding "this" to this instance inside the given closure.
+        "this" can't be reassigned, so the env is created once and shared by every
+        method bound to this instance. Each bind still creates a new Function
+        , that is, bound methods keep their identity equality
+        """
+        # only the first bind through a closure misses
+        try:
+            return self._this_envs[closure]
+        except KeyError:
+            env = Environment(closure)
+            env.define("this", self)
+            self._this_envs[closure] = env
+
+            return env
 
     def get(self, name: Token):
         if name.lexeme in self.fields:
@@ -253,14 +450,58 @@ class Instance:
         return f"{self.kclass.name.lexeme} instance"
 
 
+# all the AST nodes a visitor may dispatch on
+NODE_CLASSES: tuple[type[Node], ...] = (
+    Unary,
+    Binary,
+    BinaryWithNumber,
+    Literal,
+    Grouping,
+    Variable,
+    Assign,
+    Logical,
+    Call,
+    CallFunction,
+    Get,
+    Set,
+    This,
+    Super,
+    Expression,
+    Print,
+    Var,
+    Block,
+    IfStmt,
+    WhileStmt,
+    Function,
+    ReturnStmt,
+    Class,
+)
+
+
 class ExprVisitor:
-    def visit(self, expr: Expr | Stmt):
-        method_name = f"visit_{type(expr).__name__}"
-        method = getattr(self, method_name, None)
-        if method is None:
-            method = self.generic_visit
+    # the dispatch table of each visitor class, { AST class: visit_* function }
+    _visit_table: dict[type, Callable[[Any, Any], Any]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # build the table once when the visitor class is created
+        cls._visit_table = {}
+        for node_class in NODE_CLASSES:
+            method = getattr(cls, node_class._visit_attr, None)
+            if method is not None:
+                cls._visit_table[node_class] = method
+
+    def __init__(self):
+        # bind the class's table to this visitor once
+        # , so a visit is a dict lookup plus a call
+        self._dispatch: dict[type, Callable[[Any], Any]] = {
+            node_class: method.__get__(self)
+            for node_class, method in type(self)._visit_table.items()
+        }
 
-        return method(expr)
+    def visit(self, expr: Expr | Stmt):
+        method = self._dispatch.get(type(expr))
+        return method(expr) if method is not None else self.generic_visit(expr)
 
     def generic_visit(self, expr):
         err = f"No {type(expr).__name__} method"
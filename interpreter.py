@@ -1,4 +1,6 @@
 import time
+from operator import add, sub, mul, truediv, gt, ge, lt, le, eq, ne
+from typing import Any, Callable
 from tokens import TokenType, Token
 from expr import (
     ExprVisitor,
@@ -7,6 +9,7 @@ from expr import (
     Expr,
     Unary,
     Binary,
+    BinaryWithNumber,
     Print,
     Expression,
     Var,
@@ -18,6 +21,7 @@ from expr import (
     Logical,
     WhileStmt,
     Call,
+    CallFunction,
     Get,
     Set,
     This,
@@ -27,176 +31,302 @@ from expr import (
     Class,
     Instance,
 )
-from errors import InterpreterError, ReturnException
+from errors import InterpreterError, Returning, RETURNING
 from environment import Environment
 from utils import set_arity
 
 
-class Interpreter(ExprVisitor):
-    # global environment
-    globals: Environment = Environment()
+def _is_equal(left: Any, right: Any) -> bool:
+    if left is None and right is None:
+        return True
+    if left is None:
+        return False
 
-    def __init__(self):
-        # tracks the current environment
-        self.environment = self.globals
-        self.locals: dict[Expr, int] = {}
-        self.globals.define("clock", set_arity(0)(time.time))
+    # in python, True == 1.0 is True, that's not the expected behavior
+    return left == right if type(left) == type(right) else False
 
-    def _check_number_operand(self, operator: Token, operand):
-        if isinstance(operand, float):
-            return
-        raise InterpreterError(operator, "Operand must be a number")
 
-    def _check_number_operands(self, operator: Token, left, right):
-        if isinstance(left, float) and isinstance(right, float):
-            return
+def _operands_must_be_numbers(operator: Token) -> InterpreterError:
+    return InterpreterError(operator, "Operands must be numbers")
+
+
+# the numeric operators are spelled out one by one, so the arithmetic itself
+# compiles to a single bytecode instead of a call through the operator module
+def _greater(left: Any, right: Any, operator: Token) -> bool:
+    if type(left) is float and type(right) is float:
+        return left > right
+    raise _operands_must_be_numbers(operator)
 
-        raise InterpreterError(operator, "Operands must be numbers")
 
-    def _evaluate(self, expr: Expr | Stmt):
-        return self.visit(expr)
+def _greater_equal(left: Any, right: Any, operator: Token) -> bool:
+    if type(left) is float and type(right) is float:
+        return left >= right
+    raise _operands_must_be_numbers(operator)
 
-    def _is_truthy(self, obj) -> bool:
-        """only false/nil are falsey, and everything else is truthy"""
-        if obj is None:
-            return False
-        if isinstance(obj, bool) and not obj:
-            return False
 
-        return True
+def _less(left: Any, right: Any, operator: Token) -> bool:
+    if type(left) is float and type(right) is float:
+        return left < right
+    raise _operands_must_be_numbers(operator)
 
-    def _is_equal(self, left, right) -> bool:
-        if left is None and right is None:
-            return True
-        if left is None:
-            return False
 
-        # in python, True == 1.0 is True, that's not the expected behavior
-        return left == right if type(left) == type(right) else False
+def _less_equal(left: Any, right: Any, operator: Token) -> bool:
+    if type(left) is float and type(right) is float:
+        return left <= right
+    raise _operands_must_be_numbers(operator)
 
-    def visit_Literal(self, expr: Literal):
-        return expr.value
 
-    def visit_Grouping(self, expr: Grouping):
-        return self._evaluate(expr.expression)
+def _subtract(left: Any, right: Any, operator: Token) -> float:
+    if type(left) is float and type(right) is float:
+        return left - right
+    raise _operands_must_be_numbers(operator)
 
-    def visit_Unary(self, expr: Unary):
-        right = self._evaluate(expr.right)
 
-        match expr.operator.type:
-            case TokenType.BANG:
-                return not self._is_truthy(right)
-            case TokenType.MINUS:
-                self._check_number_operand(expr.operator, right)
-                return -right
+def _divide(left: Any, right: Any, operator: Token) -> float:
+    if type(left) is float and type(right) is float:
+        return left / right
+    raise _operands_must_be_numbers(operator)
 
-        # unreachable
-        return None
 
-    def visit_Binary(self, expr: Binary):
+def _multiply(left: Any, right: Any, operator: Token) -> float:
+    if type(left) is float and type(right) is float:
+        return left * right
+    raise _operands_must_be_numbers(operator)
+
+
+def _add(left: Any, right: Any, operator: Token) -> float | str:
+    left_type = type(left)
+    if left_type is float and type(right) is float:
+        return left + right
+    elif left_type is str and type(right) is str:
+        return left + right
+    raise InterpreterError(operator, "Operands must be two numbers or two strings.")
+
+
+def _negate(right: Any, operator: Token) -> float:
+    if type(right) is float:
+        return -right
+    raise InterpreterError(operator, "Operand must be a number")
+
+
+# { operator type: handler(left, right, operator token) }
+BINARY_OPS: dict[TokenType, Callable[[Any, Any, Token], Any]] = {
+    TokenType.GREATER: _greater,
+    TokenType.GREATER_EQUAL: _greater_equal,
+    TokenType.LESS: _less,
+    TokenType.LESS_EQUAL: _less_equal,
+    TokenType.MINUS: _subtract,
+    TokenType.PLUS: _add,
+    TokenType.SLASH: _divide,
+    TokenType.STAR: _multiply,
+    TokenType.BANG_EQUAL: lambda left, right, _: not _is_equal(left, right),
+    TokenType.EQUAL_EQUAL: lambda left, right, _: _is_equal(left, right),
+}
+
+# { operator type: operation on two numbers }, the fast path when both operands are
+# numbers, which needs neither the type checks nor a Python-level call
+NUMBER_OPS: dict[TokenType, Callable[[float, float], Any]] = {
+    TokenType.GREATER: gt,
+    TokenType.GREATER_EQUAL: ge,
+    TokenType.LESS: lt,
+    TokenType.LESS_EQUAL: le,
+    TokenType.MINUS: sub,
+    TokenType.PLUS: add,
+    TokenType.SLASH: truediv,
+    TokenType.STAR: mul,
+    TokenType.BANG_EQUAL: ne,
+    TokenType.EQUAL_EQUAL: eq,
+}
+
+# { operator type: handler(right, operator token) }
+UNARY_OPS: dict[TokenType, Callable[[Any, Token], Any]] = {
+    # only false and nil are falsey
+    TokenType.BANG: lambda right, _: right is None or right is False,
+    TokenType.MINUS: _negate,
+}
+
+# the printed form of small whole numbers, the ones most programs print
+# , 0 is left out since -0.0 == 0.0 but the former prints as "-0"
+_SMALL_NUMBER_STRS: dict[float, str] = {
+    float(i): str(i) for i in range(-128, 129) if i != 0
+}
+# stop memoizing printed numbers past this many, so the cache stays small
+_NUMBER_STRS_LIMIT = 1024
+
+
+class Interpreter(ExprVisitor):
+    def __init__(self) -> None:
+        # global environment, one per interpreter
+        # , so running several programs in one process doesn't mix their globals
+        self.globals = Environment()
+        # tracks the current environment
+        self.environment = self.globals
+        # the value of the return statement being executed
+        self._return_value = None
+        # { number: its printed form }, seeded with the small whole numbers
+        self._number_strs: dict[float, str] = dict(_SMALL_NUMBER_STRS)
+        self.globals.define("clock", set_arity(0)(time.time))
+        # builds self._dispatch, { node class: bound visit method }
+        super().__init__()
+
+    def _evaluate(self, expr: Expr | Stmt) -> Any:
+        return self._dispatch[type(expr)](expr)
+
+    def visit_Literal(self, expr: Literal) -> Any:
+        return expr.value
+
+    def visit_Grouping(self, expr: Grouping) -> Any:
+        return self._dispatch[type(expr.expression)](expr.expression)
+
+    def visit_Unary(self, expr: Unary) -> Any:
+        right = self._dispatch[type(expr.right)](expr.right)
+        op_type = expr.op_type
+        # the success paths need no handler call, only a failed check builds an error
+        if op_type is TokenType.MINUS and type(right) is float:
+            return -right
+        if op_type is TokenType.BANG:
+            return right is None or right is False
+
+        return UNARY_OPS[expr.op_type](right, expr.operator)
+
+    def visit_Binary(self, expr: Binary) -> Any:
         # evaluate the operands in left-to-right order
-        left = self._evaluate(expr.left)
-        right = self._evaluate(expr.right)
-
-        match expr.operator.type:
-            case TokenType.GREATER:
-                self._check_number_operands(expr.operator, left, right)
-                return left > right
-            case TokenType.GREATER_EQUAL:
-                self._check_number_operands(expr.operator, left, right)
-                return left >= right
-            case TokenType.LESS:
-                self._check_number_operands(expr.operator, left, right)
-                return left < right
-            case TokenType.LESS_EQUAL:
-                self._check_number_operands(expr.operator, left, right)
-                return left <= right
-            case TokenType.MINUS:
-                self._check_number_operands(expr.operator, left, right)
-                return left - right
-            case TokenType.PLUS:
-                if isinstance(left, float) and isinstance(right, float):
-                    return left + right
-                elif isinstance(left, str) and isinstance(right, str):
-                    return left + right
-                raise InterpreterError(
-                    expr.operator, "Operands must be two numbers or two strings."
-                )
-            case TokenType.SLASH:
-                self._check_number_operands(expr.operator, left, right)
-                return left / right
-            case TokenType.STAR:
-                self._check_number_operands(expr.operator, left, right)
-                return left * right
-            case TokenType.BANG_EQUAL:
-                return not self._is_equal(left, right)
-            case TokenType.EQUAL_EQUAL:
-                return self._is_equal(left, right)
-
-        # unreachable
-        return None
+        dispatch = self._dispatch
+        left = dispatch[type(expr.left)](expr.left)
+        right = dispatch[type(expr.right)](expr.right)
+        op_type = expr.op_type
 
-    def visit_Expression(self, stmt: Expression):
+        # check the operand types once for the common case, numbers
+        if type(left) is float and type(right) is float:
+            return NUMBER_OPS[op_type](left, right)
+
+        return BINARY_OPS[op_type](left, right, expr.operator)
+
+    def visit_BinaryWithNumber(self, expr: BinaryWithNumber) -> Any:
+        left = self._dispatch[type(expr.left)](expr.left)
+        # the right operand is always a number
+        if type(left) is float:
+            return NUMBER_OPS[expr.op_type](left, expr.number)
+
+        return BINARY_OPS[expr.op_type](left, expr.number, expr.operator)
+
+    def visit_Expression(self, stmt: Expression) -> None:
         # statements produce no values
-        self._evaluate(stmt.expression)
+        self._dispatch[type(stmt.expression)](stmt.expression)
 
         return None
 
-    def visit_Print(self, stmt: Print):
+    def visit_Print(self, stmt: Print) -> None:
         # statements produce no values
-        value = self._evaluate(stmt.expression)
+        value = self._dispatch[type(stmt.expression)](stmt.expression)
 
         print(self.stringify(value))
 
         return None
 
-    def visit_Var(self, stmt: Var):
+    def visit_Var(self, stmt: Var) -> None:
         value = None
         if stmt.initializer:
-            value = self._evaluate(stmt.initializer)
+            value = self._dispatch[type(stmt.initializer)](stmt.initializer)
 
-        self.environment.define(stmt.name.lexeme, value)
+        environment = self.environment
+        if environment.enclosing is not None:
+            # a local goes straight into the next slot, no name is needed
+            environment.slots.append(value)
+        else:
+            environment.values[stmt.name.lexeme] = value
 
-    def visit_Variable(self, expr: Variable):
-        return self.lookup_variable(expr.name, expr)
+    def visit_Variable(self, expr: Variable) -> Any:
+        """Lookup variable based on its distance, or it may be a global variable"""
+        distance = expr.distance
+        if distance is not None:
+            # index the flattened ancestor slots directly, skipping a method call
+            return self.environment.ancestor_slots[distance][expr.slot]
+        else:
+            return self.globals.get(expr.name)
 
-    def visit_Assign(self, expr: Assign):
-        value = self._evaluate(expr.value)
-        distance = self.locals.get(expr)
+    def visit_Assign(self, expr: Assign) -> Any:
+        value = self._dispatch[type(expr.value)](expr.value)
+        distance = expr.distance
         if distance is not None:
-            self.environment.assign_at(distance, expr.name, value)
+            # index the flattened ancestor slots directly, skipping a method call
+            self.environment.ancestor_slots[distance][expr.slot] = value
         else:
             self.globals.assign(expr.name, value)
 
         return value
 
-    def visit_Logical(self, expr: Logical):
+    def visit_Logical(self, expr: Logical) -> Any:
         """A logic operator merely guarantees it will return a value with appropriate truthiness"""
-        left = self._evaluate(expr.left)
+        left = self._dispatch[type(expr.left)](expr.left)
 
-        if expr.operator.type == TokenType.OR:
-            if self._is_truthy(left):
+        # only false and nil are falsey, and everything else is truthy
+        if expr.op_type is TokenType.OR:
+            if left is not None and left is not False:
                 return left
         else:
-            if not self._is_truthy(left):
+            if left is None or left is False:
                 return left
 
-        return self._evaluate(expr.right)
+        return self._dispatch[type(expr.right)](expr.right)
+
+    def visit_Call(self, expr: Call) -> Any:
+        callee = self._dispatch[type(expr.callee)](expr.callee)
+        return self._call(expr, callee)
+
+    def visit_CallFunction(self, expr: CallFunction) -> Any:
+        dispatch = self._dispatch
+        callee = dispatch[type(expr.callee)](expr.callee)
+        if callee is not expr._cached_callee:
+            # e.g. the variable now holds another function, check everything again
+            expr.__class__ = Call
+            expr._cached_callee = None
+            return self._call(expr, callee)
+
+        # the same function was already checked here, its arity can't change
+        if not expr.arguments:
+            return callee(self, ())
+        return callee(
+            self, [dispatch[type(argument)](argument) for argument in expr.arguments]
+        )
 
-    def visit_Call(self, expr: Call):
-        callee = self._evaluate(expr.callee)
-        arguments: list[Expr] = []
-        for argument in expr.arguments:
-            arguments.append(self._evaluate(argument))
+    def _call(self, expr: Call, callee: Any) -> Any:
+        dispatch = self._dispatch
+        # calls without arguments, e.g. `clock()`, share one empty tuple
+        arguments = (
+            [dispatch[type(argument)](argument) for argument in expr.arguments]
+            if expr.arguments
+            else ()
+        )
 
-        if not callable(callee):
-            raise InterpreterError(expr.paren, "Can only call functions and classes")
-        if callee.arity != len(arguments):
+        callee_type = type(callee)
+        # a call site almost always sees the same kind of callee
+        # , so only check and classify it when that kind changes
+        if callee_type is not expr._callee_type:
+            if not callable(callee):
+                raise InterpreterError(
+                    expr.paren, "Can only call functions and classes"
+                )
+            expr._callee_type = callee_type
+            expr._is_lox_callable = callee_type is Function or callee_type is Class
+        arity = callee.arity
+        if arity != len(arguments):
             raise InterpreterError(
                 expr.paren,
-                f"Expected {callee.arity} arguments but got {len(arguments)}.",
+                f"Expected {arity} arguments but got {len(arguments)}.",
             )
-        if isinstance(callee, Function) or isinstance(callee, Class):
+        if (
+            callee_type is Function
+            and type(expr.callee) is Variable
+            and expr.callee.distance is None
+        ):
+            # specialize this call site for the function, see visit_CallFunction
+            # , only for a global, a method is bound anew on every access and a local
+            # , function is a new closure on every run, so neither is the same object
+            expr._cached_callee = callee
+            expr.__class__ = CallFunction
+            return callee(self, arguments)
+        elif expr._is_lox_callable:
             return callee(self, arguments)
         else:
             # for built-in function
@@ -204,34 +334,33 @@ class Interpreter(ExprVisitor):
             # , so we can just use callee(arguments)
             return callee() if not arguments else callee(arguments)
 
-    def visit_Get(self, expr: Get):
-        obj = self._evaluate(expr.obj)
-        if isinstance(obj, Instance):
+    def visit_Get(self, expr: Get) -> Any:
+        obj = self._dispatch[type(expr.obj)](expr.obj)
+        if type(obj) is Instance:
             return obj.get(expr.name)
         else:
             raise InterpreterError(expr.name, "Only instances have properties.")
 
-    def visit_Set(self, expr: Set):
-        obj = self._evaluate(expr.obj)
+    def visit_Set(self, expr: Set) -> Any:
+        obj = self._dispatch[type(expr.obj)](expr.obj)
 
-        if not isinstance(obj, Instance):
+        if type(obj) is not Instance:
             raise InterpreterError(expr.name, "Only instances have fields.")
 
-        value = self._evaluate(expr.value)
+        value = self._dispatch[type(expr.value)](expr.value)
         obj.set(expr.name, value)
 
         return value
 
-    def visit_This(self, expr: This):
-        return self.lookup_variable(expr.keyword, expr)
+    def visit_This(self, expr: This) -> Any:
+        # "this" is always resolved to a local, the resolver rejects it elsewhere
+        return self.environment.ancestor_slots[expr.distance][expr.slot]
 
-    def visit_Super(self, expr: Super):
-        distance = self.locals.get(
-            expr, -1
-        )  # use default -1 just to pass the type checker
-        assert distance != -1, "This is impossible"
-        superclass: Class = self.environment.get_at(distance, "super")
-        obj = self.environment.get_at(distance - 1, "this")
+    def visit_Super(self, expr: Super) -> Function:
+        distance = expr.distance
+        superclass: Class = self.environment.get_at(distance, expr.slot)
+        # "this" is the only variable in the env right inside the "super" env
+        obj = self.environment.get_at(distance - 1, 0)
         method = superclass.find_method(expr.method.lexeme)
 
         if method:
@@ -241,64 +370,113 @@ class Interpreter(ExprVisitor):
                 expr.method, f"Undefined property '{expr.method.lexeme}'."
             )
 
-    def execute_block(self, statements: list[Stmt], environment: Environment):
+    def execute_block(
+        self, statements: list[Stmt], environment: Environment
+    ) -> Returning | None:
         previous = self.environment
+        dispatch = self._dispatch
         try:
             self.environment = environment
             for stmt in statements:
-                self._evaluate(stmt)
+                returned = dispatch[type(stmt)](stmt)
+                # stop at a return statement and hand its value up
+                if returned is not None:
+                    return returned
         finally:
             # restore to previous environment even if an exception is thrown
             self.environment = previous
 
-    def visit_Block(self, stmt: Block):
-        self.execute_block(stmt.statements, Environment(self.environment))
-
         return None
 
-    def visit_IfStmt(self, stmt: IfStmt):
-        if self._is_truthy(self._evaluate(stmt.condition)):
-            self._evaluate(stmt.then_branch)
+    def visit_Block(self, stmt: Block) -> Returning | None:
+        if not stmt.has_scope:
+            # nothing is declared inside, so there is no need for a new env
+            dispatch = self._dispatch
+            for inner in stmt.statements:
+                returned = dispatch[type(inner)](inner)
+                if returned is not None:
+                    return returned
+            return None
+
+        if stmt.captured:
+            return self.execute_block(stmt.statements, Environment(self.environment))
+
+        # nothing can outlive this run of the block, so recycle its env
+        # , a free list rather than a single env, since the block may be re-entered
+        # by a recursive call before it exits
+        free_envs = stmt.free_envs
+        if free_envs:
+            environment = free_envs.pop()
+            environment.reset(self.environment)
+        else:
+            environment = Environment(self.environment)
+        try:
+            return self.execute_block(stmt.statements, environment)
+        finally:
+            environment.release()
+            free_envs.append(environment)
+
+    def visit_IfStmt(self, stmt: IfStmt) -> Returning | None:
+        condition = self._dispatch[type(stmt.condition)](stmt.condition)
+        # only false and nil are falsey, and everything else is truthy
+        if condition is not None and condition is not False:
+            return self._dispatch[type(stmt.then_branch)](stmt.then_branch)
         elif stmt.else_branch:
-            self._evaluate(stmt.else_branch)
+            return self._dispatch[type(stmt.else_branch)](stmt.else_branch)
 
         return None
 
-    def visit_WhileStmt(self, stmt: WhileStmt):
-        while self._is_truthy(self._evaluate(stmt.condition)):
-            self._evaluate(stmt.body)
+    def visit_WhileStmt(self, stmt: WhileStmt) -> Returning | None:
+        # the shape of the loop never changes, so pick the visit methods for the
+        # condition and the body once instead of on every iteration
+        condition, body = stmt.condition, stmt.body
+        evaluate_condition = self._dispatch[type(condition)]
+        execute_body = self._dispatch[type(body)]
+        while True:
+            value = evaluate_condition(condition)
+            if value is None or value is False:
+                break
+            returned = execute_body(body)
+            if returned is not None:
+                return returned
 
         return None
 
-    def visit_Function(self, stmt: Function):
-        new_function = Function(
-            stmt.name, stmt.params, stmt.body, self.environment, stmt.is_initializer
-        )
-        self.environment.define(stmt.name.lexeme, new_function)
+    def visit_Function(self, stmt: Function) -> None:
+        new_function = stmt.with_closure(self.environment)
+        environment = self.environment
+        if environment.enclosing is not None:
+            # a local goes straight into the next slot, no name is needed
+            environment.slots.append(new_function)
+        else:
+            environment.values[stmt.name.lexeme] = new_function
 
         return None
 
-    def visit_ReturnStmt(self, stmt: ReturnStmt):
+    def visit_ReturnStmt(self, stmt: ReturnStmt) -> Returning:
         value = None
         # if we have a return value, we evaluate it
         if stmt.value:
-            value = self._evaluate(stmt.value)
+            value = self._dispatch[type(stmt.value)](stmt.value)
+
+        # the function call consumes the value once RETURNING reaches it
+        self._return_value = value
 
-        raise ReturnException(value)
+        return RETURNING
 
-    def visit_Class(self, stmt: Class):
+    def visit_Class(self, stmt: Class) -> None:
         superclass = None
         if stmt.superclass:
             # by looking up the variable, we got a class here
-            superclass = self._evaluate(stmt.superclass)
+            superclass = self._dispatch[type(stmt.superclass)](stmt.superclass)
             if not isinstance(superclass, Class):
                 raise InterpreterError(
                     stmt.superclass.name, "Superclass must be a class."
                 )
             stmt._superclass = superclass
-            stmt.update_arity()
+            stmt.update_methods()
 
-        self.environment.define(stmt.name.lexeme, None)
+        self.environment.define(stmt.name.lexeme, stmt)
 
         if stmt.superclass:
             # store a reference to the superclass
@@ -313,44 +491,33 @@ class Interpreter(ExprVisitor):
         if stmt.superclass:
             self.environment = self.environment.enclosing
 
-        self.environment.assign(stmt.name, stmt)
-
         return None
 
-    def stringify(self, val) -> str:
+    def stringify(self, val: Any) -> str:
         if val is None:
             return "nil"
-        if isinstance(val, float):
-            return str(val).removesuffix(".0")
-        if (
-            callable(val)
-            and not isinstance(val, Function)
-            and not isinstance(val, Class)
-        ):
-            return "<native fn>"
+        val_type = type(val)
+        if val_type is float:
+            text = self._number_strs.get(val)
+            if text is None:
+                text = str(val).removesuffix(".0")
+                # never memoize zero, see _SMALL_NUMBER_STRS
+                if val and len(self._number_strs) < _NUMBER_STRS_LIMIT:
+                    self._number_strs[val] = text
+            return text
         # python will print True/False rather than true/false defined in Lox
-        if isinstance(val, bool):
+        if val_type is bool:
             return str(val).lower()
+        if callable(val) and val_type is not Function and val_type is not Class:
+            return "<native fn>"
 
         return str(val)
 
-    def resolve(self, expr: Expr, depth: int):
-        self.locals[expr] = depth
-
-    def lookup_variable(self, name: Token, expr: Expr):
-        """Lookup variable based on its distance, or it may be a global variable"""
-        distance = self.locals.get(expr, None)
-        # WARNING: do not write `if distance` here. Because when it returns 0,
-        # which means the variable lives in the innermost scope.
-        # And `if 0` will misinterpret this
-        if distance is not None:
-            return self.environment.get_at(distance, name.lexeme)
-        else:
-            return self.globals.get(name)
-
-    def interpret(self, stmts: list[Stmt] | list[Expr]):
+    def interpret(self, stmts: list[Stmt] | list[Expr]) -> InterpreterError | None:
+        # dispatch the top-level statements straight through the visitor table
+        dispatch = self._dispatch
         try:
             for stmt in stmts:
-                self._evaluate(stmt)
+                dispatch[type(stmt)](stmt)
         except InterpreterError as e:
             return e
@@ -0,0 +1,151 @@
+from expr import (
+    ExprVisitor,
+    Stmt,
+    Literal,
+    Grouping,
+    Unary,
+    Binary,
+    BinaryWithNumber,
+    Variable,
+    Assign,
+    Logical,
+    Call,
+    Get,
+    Set,
+    This,
+    Super,
+    Expression,
+    Print,
+    Var,
+    Block,
+    IfStmt,
+    WhileStmt,
+    Function,
+    ReturnStmt,
+    Class,
+)
+from interpreter import BINARY_OPS, UNARY_OPS
+from errors import InterpreterError
+
+
+class ConstantFolder(ExprVisitor):
+    """Replace each operator whose operands are all literals with the literal it
+    evaluates to, so the interpreter doesn't redo that work on every evaluation.
+    An operator with only a number literal on the right becomes a BinaryWithNumber,
+    and groupings are replaced with the expression inside.
+    The AST is rewritten in place: visiting an expression returns its replacement
+    , and visiting a statement updates the expressions inside it
+    """
+
+    def fold(self, statements: list[Stmt]) -> None:
+        for stmt in statements:
+            self.visit(stmt)
+
+    def visit_Literal(self, expr: Literal):
+        return expr
+
+    def visit_Grouping(self, expr: Grouping):
+        # precedence is settled once parsed, so parentheses mean nothing at runtime
+        # , e.g. an invalid assignment target like `(a) = 1` is already rejected
+        return self.visit(expr.expression)
+
+    def visit_Unary(self, expr: Unary):
+        expr.right = self.visit(expr.right)
+        if type(expr.right) is Literal:
+            try:
+                value = UNARY_OPS[expr.op_type](expr.right.value, expr.operator)
+            except InterpreterError:
+                # leave it to the interpreter to report the error at runtime
+                return expr
+            return Literal(value)
+
+        return expr
+
+    def visit_Binary(self, expr: Binary):
+        expr.left = self.visit(expr.left)
+        expr.right = self.visit(expr.right)
+        if type(expr.left) is Literal and type(expr.right) is Literal:
+            try:
+                value = BINARY_OPS[expr.op_type](
+                    expr.left.value, expr.right.value, expr.operator
+                )
+            except (InterpreterError, ZeroDivisionError):
+                # leave it to the interpreter to fail the same way at runtime
+                return expr
+            return Literal(value)
+        if type(expr.right) is Literal and type(expr.right.value) is float:
+            # e.g. `i < 10` or `i + 1`, fuse the number into the operator
+            return BinaryWithNumber(expr.left, expr.operator, expr.right)
+
+        return expr
+
+    def visit_Variable(self, expr: Variable):
+        return expr
+
+    def visit_Assign(self, expr: Assign):
+        expr.value = self.visit(expr.value)
+
+        return expr
+
+    def visit_Logical(self, expr: Logical):
+        expr.left = self.visit(expr.left)
+        expr.right = self.visit(expr.right)
+
+        return expr
+
+    def visit_Call(self, expr: Call):
+        expr.callee = self.visit(expr.callee)
+        expr.arguments = [self.visit(argument) for argument in expr.arguments]
+
+        return expr
+
+    def visit_Get(self, expr: Get):
+        expr.obj = self.visit(expr.obj)
+
+        return expr
+
+    def visit_Set(self, expr: Set):
+        expr.obj = self.visit(expr.obj)
+        expr.value = self.visit(expr.value)
+
+        return expr
+
+    def visit_This(self, expr: This):
+        return expr
+
+    def visit_Super(self, expr: Super):
+        return expr
+
+    def visit_Expression(self, stmt: Expression):
+        stmt.expression = self.visit(stmt.expression)
+
+    def visit_Print(self, stmt: Print):
+        stmt.expression = self.visit(stmt.expression)
+
+    def visit_Var(self, stmt: Var):
+        if stmt.initializer:
+            stmt.initializer = self.visit(stmt.initializer)
+
+    def visit_Block(self, stmt: Block):
+        self.fold(stmt.statements)
+
+    def visit_IfStmt(self, stmt: IfStmt):
+        stmt.condition = self.visit(stmt.condition)
+        self.visit(stmt.then_branch)
+        if stmt.else_branch:
+            self.visit(stmt.else_branch)
+
+    def visit_WhileStmt(self, stmt: WhileStmt):
+        stmt.condition = self.visit(stmt.condition)
+        self.visit(stmt.body)
+
+    def visit_Function(self, stmt: Function):
+        self.fold(stmt.body.statements)
+
+    def visit_ReturnStmt(self, stmt: ReturnStmt):
+        if stmt.value:
+            stmt.value = self.visit(stmt.value)
+
+    def visit_Class(self, stmt: Class):
+        for method in stmt.methods.values():
+            self.visit(method)
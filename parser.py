@@ -26,28 +26,56 @@ from expr import (
 )
 from errors import ParseError
 
+# the operators of each precedence level, built once instead of on every _match
+_EQUALITY_OPS = (TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL)
+_COMPARISON_OPS = (
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+)
+_TERM_OPS = (TokenType.MINUS, TokenType.PLUS)
+_FACTOR_OPS = (TokenType.SLASH, TokenType.STAR)
+_UNARY_OPS = (TokenType.BANG, TokenType.MINUS)
+_LITERAL_TYPES = (TokenType.NUMBER, TokenType.STRING)
+# the keywords a statement can start with, where _synchronize stops discarding
+_STATEMENT_STARTS = (
+    TokenType.CLASS,
+    TokenType.FUN,
+    TokenType.VAR,
+    TokenType.FOR,
+    TokenType.IF,
+    TokenType.WHILE,
+    TokenType.PRINT,
+    TokenType.RETURN,
+)
+# literal nodes are never modified, so every true/false/nil shares one node
+_TRUE = Literal(True)
+_FALSE = Literal(False)
+_NIL = Literal(None)
+
 
 class Parser:
     def __init__(self, tokens: list[Token]):
-        self.tokens = tokens
-        self.current = 0
-
-    def _synchronize(self):
+        # { number/string literal: its shared value }, only numbers and strings go
+        # in here, and those never compare equal to each other
+        self._constants: dict[float | str, float | str] = {}
+        self.reset(tokens)
+
+    def reset(self, tokens: list[Token]):
+        """Start over on new tokens, so the REPL can keep one parser for every line"""
+        self.tokens: list[Token] = tokens
+        # the type of each token, so checking a type needs no Token attribute walk
+        self._types: list[TokenType] = [token.type for token in tokens]
+        self.current: int = 0
+
+    def _synchronize(self) -> None:
         """It discards tokens until it thinks it has found a statement boundary """
         self._advance()
         while not self._is_at_end():
-            if self._previous().type == TokenType.SEMICOLON:
+            if self._types[self.current - 1] is TokenType.SEMICOLON:
                 return
-            if self._peek().type in [
-                TokenType.CLASS,
-                TokenType.FUN,
-                TokenType.VAR,
-                TokenType.FOR,
-                TokenType.IF,
-                TokenType.WHILE,
-                TokenType.PRINT,
-                TokenType.RETURN,
-            ]:
+            if self._types[self.current] in _STATEMENT_STARTS:
                 return
             self._advance()
 
@@ -57,7 +85,7 @@ class Parser:
         return err
 
     def _is_at_end(self) -> bool:
-        return self._peek().type == TokenType.EOF
+        return self._types[self.current] is TokenType.EOF
 
     def _previous(self) -> Token:
         """Return the most recently consumed token"""
@@ -65,34 +93,42 @@ class Parser:
 
     def _check(self, _type: TokenType) -> bool:
         """Return True if the current token is of the given _type"""
-        if self._is_at_end():
-            return False
-
-        return self._peek().type == _type
+        # the scanner always ends the tokens with EOF, and no caller checks for EOF
+        # , so at the end this is already False without a separate check
+        return self._types[self.current] is _type
 
     def _advance(self) -> Token:
         """Consume the current token and returns it"""
-        if not self._is_at_end():
+        if self._types[self.current] is not TokenType.EOF:
             self.current += 1
 
-        return self._previous()
+        return self.tokens[self.current - 1]
 
     def _peek(self) -> Token:
         """Return the current token we have yet to consume"""
         return self.tokens[self.current]
 
-    def _match(self, types: list[TokenType]) -> bool:
+    def _match(self, types: tuple[TokenType, ...]) -> bool:
         """Check if the current token hash any of the given types.
         If so, it consumes the token and returns True
         """
-        for _type in types:
-            if self._check(_type):
-                self._advance()
-                return True
+        # same as _check + _advance, but without the method calls
+        if self._types[self.current] in types:
+            self.current += 1
+            return True
+
+        return False
+
+    def _match1(self, _type: TokenType) -> bool:
+        """Same as _match, but for a single type, which is what most callers need"""
+        # no parser rule matches EOF itself, so there is no need to check for it
+        if self._types[self.current] is _type:
+            self.current += 1
+            return True
 
         return False
 
-    def _consume(self, _type: TokenType, msg: str):
+    def _consume(self, _type: TokenType, msg: str) -> Token:
         if self._check(_type):
             return self._advance()
 
@@ -102,16 +138,17 @@ class Parser:
         """expression  -> assignment"""
         return self._assignment()
 
-    def _assignment(self):
+    def _assignment(self) -> Expr:
         """assignment  -> (call ".")? IDENTIFIER "=" assignment | logic_or"""
         expr = self._logic_or()
 
-        if self._match([TokenType.EQUAL]):
+        if self._match1(TokenType.EQUAL):
             equals = self._previous()
             value = self._assignment()
-            if isinstance(expr, Variable):
+            # neither node has subclasses, so compare the classes directly
+            if type(expr) is Variable:
                 return Assign(expr.name, value)
-            elif isinstance(expr, Get):
+            elif type(expr) is Get:
                 return Set(expr.obj, expr.name, value)
             raise self._error(equals, "Invalid assignment target.")
 
@@ -121,8 +158,9 @@ class Parser:
         """logic_or    -> logic_and ( "or" logic_and )*"""
         expr = self._logic_and()
 
-        while self._match([TokenType.OR]):
-            operator = self._previous()
+        while self._match1(TokenType.OR):
+            # the operator was just consumed by _match
+            operator = self.tokens[self.current - 1]
             right = self._logic_and()
             expr = Logical(expr, operator, right)
 
@@ -132,8 +170,8 @@ class Parser:
         """logic_and   -> equality ( "and" equality )*"""
         expr = self._equality()
 
-        while self._match([TokenType.AND]):
-            operator = self._previous()
+        while self._match1(TokenType.AND):
+            operator = self.tokens[self.current - 1]
             right = self._equality()
             expr = Logical(expr, operator, right)
 
@@ -145,9 +183,9 @@ class Parser:
         expr = self._comparison()
 
         # the (...)* loop maps to a while loop
-        while self._match([TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL]):
+        while self._match(_EQUALITY_OPS):
             # inside the rule, we must first find either != or ==
-            operator = self._previous()
+            operator = self.tokens[self.current - 1]
             right = (
                 self._comparison()
             )  # call self._comparison() again to parse the RHS operand
@@ -161,15 +199,8 @@ class Parser:
         """comparison  -> term ( ( ">" | ">=" | "<" | "<=" ) term)*"""
         expr = self._term()
 
-        while self._match(
-            [
-                TokenType.GREATER,
-                TokenType.GREATER_EQUAL,
-                TokenType.LESS,
-                TokenType.LESS_EQUAL,
-            ]
-        ):
-            operator = self._previous()
+        while self._match(_COMPARISON_OPS):
+            operator = self.tokens[self.current - 1]
             right = self._term()
             expr = Binary(expr, operator, right)
 
@@ -179,8 +210,8 @@ class Parser:
         """term        -> factor ( ( "-" | "+" ) factor)*"""
         expr = self._factor()
 
-        while self._match([TokenType.MINUS, TokenType.PLUS]):
-            operator = self._previous()
+        while self._match(_TERM_OPS):
+            operator = self.tokens[self.current - 1]
             right = self._factor()
             expr = Binary(expr, operator, right)
 
@@ -190,30 +221,31 @@ class Parser:
         """factor      -> unary ( ( "/" | "*" ) unary)*"""
         expr = self._unary()
 
-        while self._match([TokenType.SLASH, TokenType.STAR]):
-            operator = self._previous()
-            right = self._factor()
+        while self._match(_FACTOR_OPS):
+            operator = self.tokens[self.current - 1]
+            right = self._unary()
             expr = Binary(expr, operator, right)
 
         return expr
 
     def _unary(self) -> Expr:
         """unary       -> ( "!" | "-" ) unary | call"""
-        if self._match([TokenType.BANG, TokenType.MINUS]):
-            operator = self._previous()
+        if self._match(_UNARY_OPS):
+            operator = self.tokens[self.current - 1]
             right = self._unary()
             return Unary(operator, right)
 
         return self._call()
 
-    def _finish_call(self, callee) -> Call:
+    def _finish_call(self, callee: Expr) -> Call:
         """arguments   -> expression ( "," expression )*"""
         arguments = []
         if not self._check(TokenType.RIGHT_PAREN):
+            append = arguments.append
             while True:
                 # Python 3.7+, there is no maximum arguments limitation
-                arguments.append(self._expression())
-                if not self._match([TokenType.COMMA]):
+                append(self._expression())
+                if not self._match1(TokenType.COMMA):
                     break
         paren = self._consume(TokenType.RIGHT_PAREN, "Expect ')' after arguments.")
 
@@ -223,9 +255,9 @@ class Parser:
         """call        -> primary ( "(" arguments? ")" | "." IDENTIFIER )* ;"""
         expr = self._primary()
         while True:
-            if self._match([TokenType.LEFT_PAREN]):
+            if self._match1(TokenType.LEFT_PAREN):
                 expr = self._finish_call(expr)
-            elif self._match([TokenType.DOT]):
+            elif self._match1(TokenType.DOT):
                 name = self._consume(
                     TokenType.IDENTIFIER, "Expect property name after '.'."
                 )
@@ -237,20 +269,22 @@ class Parser:
 
     def _primary(self) -> Expr:
         """primary     -> NUMBER | STRING | IDENTIFIER | "this" | true" | "false" | "nil" | "super" "." IDENTIFIER | (" expression ")" """
-        if self._match([TokenType.NUMBER, TokenType.STRING]):
-            return Literal(self._previous().literal)
-        if self._match([TokenType.IDENTIFIER]):
+        if self._match(_LITERAL_TYPES):
+            literal = self._previous().literal
+            # repeated constants share one value object
+            return Literal(self._constants.setdefault(literal, literal))
+        if self._match1(TokenType.IDENTIFIER):
             return Variable(self._previous())
-        if self._match([TokenType.THIS]):
+        if self._match1(TokenType.THIS):
             return This(self._previous())
-        if self._match([TokenType.TRUE]):
-            return Literal(True)
-        if self._match([TokenType.FALSE]):
-            return Literal(False)
-        if self._match([TokenType.NIL]):
-            return Literal(None)
-
-        if self._match([TokenType.SUPER]):
+        if self._match1(TokenType.TRUE):
+            return _TRUE
+        if self._match1(TokenType.FALSE):
+            return _FALSE
+        if self._match1(TokenType.NIL):
+            return _NIL
+
+        if self._match1(TokenType.SUPER):
             keyword = self._previous()
             self._consume(TokenType.DOT, "Expect '.' after 'super'.")
             method = self._consume(
@@ -258,7 +292,7 @@ class Parser:
             )
 
             return Super(keyword, method)
-        if self._match([TokenType.LEFT_PAREN]):
+        if self._match1(TokenType.LEFT_PAREN):
             expr = self._expression()
             self._consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
             return Grouping(expr)
@@ -282,9 +316,15 @@ class Parser:
     def _block(self) -> Block:
         """block       -> "{" declarations* "}" """
         statements = []
-        # use self._is_at_end() to avoid infinite loop
-        while not self._check(TokenType.RIGHT_BRACE) and not self._is_at_end():
-            statements.append(self._declarations())
+        # hoist the lookups out of the loop
+        append = statements.append
+        types = self._types
+        # stop at EOF to avoid infinite loop
+        while (
+            types[self.current] is not TokenType.RIGHT_BRACE
+            and types[self.current] is not TokenType.EOF
+        ):
+            append(self._declarations())
         self._consume(TokenType.RIGHT_BRACE, "Expect '}' after block.")
 
         return Block(statements)
@@ -294,15 +334,20 @@ class Parser:
         name = self._consume(TokenType.IDENTIFIER, "Expect class name.")
 
         superclass = None
-        if self._match([TokenType.LESS]):
+        if self._match1(TokenType.LESS):
             self._consume(TokenType.IDENTIFIER, "Expect superclass name.")
             superclass = Variable(self._previous())
 
         self._consume(TokenType.LEFT_BRACE, "Expect '{' before class body.")
 
         methods = []
-        while not self._check(TokenType.RIGHT_BRACE) and not self._is_at_end():
-            methods.append(self._func_declaration("method"))
+        append = methods.append
+        types = self._types
+        while (
+            types[self.current] is not TokenType.RIGHT_BRACE
+            and types[self.current] is not TokenType.EOF
+        ):
+            append(self._func_declaration("method"))
 
         self._consume(TokenType.RIGHT_BRACE, "Expect '}' after class body.")
 
@@ -324,7 +369,7 @@ class Parser:
                 parameters.append(
                     self._consume(TokenType.IDENTIFIER, "Expect parameter name.")
                 )
-                if not self._match([TokenType.COMMA]):
+                if not self._match1(TokenType.COMMA):
                     break
         self._consume(TokenType.RIGHT_PAREN, f"Expect ')' after {kind} name")
         # the _block() method assumes the brace token has already been matched
@@ -337,38 +382,32 @@ class Parser:
         """varDecl     -> "var" IDENTIFIER ( "=" expression )? ";" """
         name = self._consume(TokenType.IDENTIFIER, "Expect variable name.")
         initializer = None
-        if self._match([TokenType.EQUAL]):
+        if self._match1(TokenType.EQUAL):
             initializer = self._expression()
         self._consume(TokenType.SEMICOLON, "Expect ';' after variable declaration.")
 
         return Var(name, initializer)
 
-    def _declarations(self):
+    def _declarations(self) -> Stmt:
         """declaration -> classDecl | funcDecl | varDecl | statement"""
-        # NOTE: Disable self._synchronize so that we can pass the tests
-        # try:
-        #     if self._match([TokenType.CLASS]):
-        #         return self._class_declaration()
-        #     if self._match([TokenType.FUN]):
-        #         return self._func_declaration("function")
-        #     if self._match([TokenType.VAR]):
-        #         return self._var_declaration()
-
-        #     return self._statement()
-        # except ParseError as e:
-        #     self._synchronize()
-        #     return None
-
-        if self._match([TokenType.CLASS]):
-            return self._class_declaration()
-        if self._match([TokenType.FUN]):
-            return self._func_declaration("function")
-        if self._match([TokenType.VAR]):
-            return self._var_declaration()
+        # NOTE: errors are not recovered with self._synchronize so that we can pass the tests
+
+        # one lookup instead of trying each keyword in turn
+        rule = self._DECLARATION_RULES.get(self._types[self.current])
+        if rule is not None:
+            self.current += 1
+            return rule(self)
 
         return self._statement()
 
-    def _if_statement(self):
+    # { keyword: the method parsing the rest of the declaration }
+    _DECLARATION_RULES = {
+        TokenType.CLASS: _class_declaration,
+        TokenType.FUN: lambda self: self._func_declaration("function"),
+        TokenType.VAR: _var_declaration,
+    }
+
+    def _if_statement(self) -> IfStmt:
         """ifStmt      -> "if" "(" expression ")" statement ( "else" statement )?"""
         self._consume(TokenType.LEFT_PAREN, "Expect '(' after 'if'")
         condition = self._expression()
@@ -376,12 +415,12 @@ class Parser:
 
         then_branch = self._statement()
         else_branch = None
-        if self._match([TokenType.ELSE]):
+        if self._match1(TokenType.ELSE):
             else_branch = self._statement()
 
         return IfStmt(condition, then_branch, else_branch)
 
-    def _while_statement(self):
+    def _while_statement(self) -> WhileStmt:
         """whileStmt   -> "while" "(" expression ")" statement"""
         self._consume(TokenType.LEFT_PAREN, "Expect '(' after 'if'")
         condition = self._expression()
@@ -391,12 +430,12 @@ class Parser:
 
         return WhileStmt(condition, statement)
 
-    def _for_statement(self):
+    def _for_statement(self) -> Stmt:
         """forStmt     -> "for" "(" ( varDecl | exprStmt | ";" ) expression? ";" expression? ")" statement ;"""
         self._consume(TokenType.LEFT_PAREN, "Expect '(' after 'for'")
-        if self._match([TokenType.VAR]):
+        if self._match1(TokenType.VAR):
             initializer = self._var_declaration()
-        elif self._match([TokenType.SEMICOLON]):
+        elif self._match1(TokenType.SEMICOLON):
             initializer = None
         else:
             initializer = self._expression_statement()
@@ -419,7 +458,7 @@ class Parser:
             body = Block([body, Expression(increment)])
 
         if condition is None:
-            condition = Literal(True)
+            condition = _TRUE
 
         body = WhileStmt(condition, body)
 
@@ -440,24 +479,29 @@ class Parser:
 
     def _statement(self) -> Stmt:
         """statement   -> exprStmt | forStmt | ifStmt | printStmt | returnStmt | whileStmt | block"""
-        if self._match([TokenType.FOR]):
-            return self._for_statement()
-        if self._match([TokenType.IF]):
-            return self._if_statement()
-        if self._match([TokenType.PRINT]):
-            return self._print_statement()
-        if self._match([TokenType.RETURN]):
-            return self._return_statement()
-        if self._match([TokenType.WHILE]):
-            return self._while_statement()
-        if self._match([TokenType.LEFT_BRACE]):
-            return self._block()
+        # each rule expects its first token to be consumed already
+        rule = self._STATEMENT_RULES.get(self._types[self.current])
+        if rule is not None:
+            self.current += 1
+            return rule(self)
 
         return self._expression_statement()
 
+    # { first token: the method parsing the rest of the statement }
+    _STATEMENT_RULES = {
+        TokenType.FOR: _for_statement,
+        TokenType.IF: _if_statement,
+        TokenType.PRINT: _print_statement,
+        TokenType.RETURN: _return_statement,
+        TokenType.WHILE: _while_statement,
+        TokenType.LEFT_BRACE: _block,
+    }
+
     def parse(self) -> list[Expr] | list[Stmt]:
         statements = []
-        while not self._is_at_end():
-            statements.append(self._declarations())
+        append = statements.append
+        types = self._types
+        while types[self.current] is not TokenType.EOF:
+            append(self._declarations())
 
         return statements
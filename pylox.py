@@ -1,87 +1,112 @@
+import io
 import sys
+import traceback
+from contextlib import redirect_stdout
 from scanner import Scanner
 from parser import Parser
 from interpreter import Interpreter
 from errors import InterpreterError, ParseError
 from resolver import Resolver
+from optimizer import ConstantFolder
 
 
 class Lox:
-    interpreter: Interpreter = Interpreter()  # only 1 interpreter is available
-    _has_error: bool = False
-    _has_runtime_error: bool = False
+    def __init__(self):
+        self.interpreter = Interpreter()  # only 1 interpreter is available
+        # the REPL scans, parses and resolves every line with the same objects
+        self._scanner = Scanner("")
+        self._parser = Parser([])
+        self._folder = ConstantFolder()
+        self._resolver = Resolver(self.interpreter)
+        self._has_error = False
+        self._has_runtime_error = False
 
-    @classmethod
-    def _run(cls, code: str):
-        lexer = Scanner(code)
+    def _run(self, code: str):
+        lexer = self._scanner
+        lexer.reset(code)
         tokens = lexer.scan_tokens()
         if lexer.has_error:
-            Lox._has_error = True
+            self._has_error = True
             return
         try:
-            parser = Parser(tokens)
-            statements = parser.parse()
+            self._parser.reset(tokens)
+            statements = self._parser.parse()
         except ParseError as e:
             print(e)
             return
 
-        resolver = Resolver(cls.interpreter)
+        # evaluate the constant expressions once, before anything runs
+        self._folder.fold(statements)
+
+        resolver = self._resolver
+        resolver.reset()
         resolver._resolve(statements)
         if resolver._has_error:
-            Lox._has_error = True
+            # a single write for all of them
+            print("\n".join(resolver.errors))
+            self._has_error = True
             return
         try:
-            cls.interpreter.interpret(statements)
+            self.interpreter.interpret(statements)
         except InterpreterError as e:
-            Lox._has_error = True
+            self._has_error = True
             print(e)
 
-    @classmethod
-    def _run_file(cls, path: str):
+    def _run_file(self, path: str):
         with open(path, "r") as f:
             code = f.read()
-        cls._run(code)
+        self._run(code)
 
         # indicate an error in the exit code
-        if cls._has_error:
+        if self._has_error:
             sys.exit(65)
-        if cls._has_runtime_error:
+        if self._has_runtime_error:
             sys.exit(70)
 
-    @classmethod
-    def _run_prompt(cls):
+    def _run_prompt(self):
         """REPL"""
         while True:
             try:
                 line = input("> ")
-                cls._run(line)
+                self._run(line)
                 # in REPL, the session should be alive even the user make a mistake
-                cls._has_error = False
+                self._has_error = False
             except EOFError:
                 break
 
-    @classmethod
-    def error(cls, line: int, msg: str):
-        cls._report(line, "", msg)
+    def error(self, line: int, msg: str):
+        self._report(line, "", msg)
 
-    @classmethod
-    def runtime_error(cls, e):
-        cls._has_runtime_error = True
+    def runtime_error(self, e):
+        self._has_runtime_error = True
 
-    @classmethod
-    def _report(cls, line: int, where: str, msg: str):
+    def _report(self, line: int, where: str, msg: str):
         print(f"[line {line}] Error {where}: {msg}", file=sys.stderr)
-        cls._has_error = True
+        self._has_error = True
 
-    @classmethod
-    def cli(cls, args: list[str]):
+    def cli(self, args: list[str]):
         if len(args) > 2:
             print("Usage: pyloc [script]")
             sys.exit(64)
         elif len(args) == 2:
-            cls._run_file(args[1])
+            self._run_file(args[1])
         else:
-            cls._run_prompt()
+            self._run_prompt()
+
+
+def run_source(code: str) -> str:
+    """Run the code with a new Lox and return everything it printed.
+    The test runner uses this instead of starting a pylox process per test
+    """
+    output = io.StringIO()
+    with redirect_stdout(output):
+        try:
+            Lox()._run(code)
+        except Exception:
+            # as if pylox crashed, the traceback goes to stderr
+            traceback.print_exc()
+
+    return output.getvalue()
 
 
 def main(args: list[str]):
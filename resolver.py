@@ -1,4 +1,3 @@
-from enum import Enum
 from expr import (
     ExprVisitor,
     Block,
@@ -27,60 +26,81 @@ from expr import (
 )
 from interpreter import Interpreter
 from tokens import Token
-from errors import error_report
+from errors import format_error
 
 
-class FunctionType(Enum):
-    NONE = 1
-    FUNCTION = 2
-    METHOD = 3
-    INITIALIZER = 4
-
-
-class ClassType(Enum):
-    NONE = 1
-    CLASS = 2
-    SUBCLASS = 3
+# the kind of function being resolved
+# , plain ints rather than an Enum, whose members are slow to look up and compare
+FT_NONE, FT_FUNCTION, FT_METHOD, FT_INITIALIZER = range(4)
+# the kind of class being resolved
+CT_NONE, CT_CLASS, CT_SUBCLASS = range(3)
 
 
 class Resolver(ExprVisitor):
     def __init__(self, interpreter: Interpreter):
+        super().__init__()
         self.interpreter = interpreter
+        self.reset()
+
+    def reset(self):
+        """Forget the last run, so the REPL can keep one resolver for every line"""
         self._scopes: list[dict[str, bool]] = []
-        self.current_func = FunctionType.NONE
-        self.current_class = ClassType.NONE
+        # the slot of each local variable, in the same order as self._scopes
+        self._slots: list[dict[str, int]] = []
+        # the blocks being resolved, from the outermost to the innermost
+        self._blocks: list[Block] = []
+        self.current_func = FT_NONE
+        self.current_class = CT_NONE
         self._has_error = False
+        # the error messages, printed all at once after resolving
+        self.errors: list[str] = []
 
-    def _resolve(
-        self,
-        statements: list[Expr] | list[Stmt] | Expr | Stmt,
-    ):
+    def _resolve(self, statements: list[Stmt]):
         """Resolve each statement inside"""
-        if isinstance(statements, list):
-            for stmt in statements:
-                self.visit(stmt)
-        else:
-            self.visit(statements)
+        # index the visitor's dispatch table directly, skipping visit()
+        dispatch = self._dispatch
+        for stmt in statements:
+            dispatch[type(stmt)](stmt)
+
+    def _resolve_one(self, node: Expr | Stmt):
+        """Resolve a single statement or expression"""
+        self._dispatch[type(node)](node)
 
     def _error_and_set_flag(
         self, token: Token, msg: str, *, show_line_number: bool = True
     ):
-        error_report(token, msg, show_line_number)
+        self.errors.append(format_error(token, msg, show_line_number))
         self._has_error = True
 
-    def _resolve_local(self, expr: Expr, name: Token):
-        for i in reversed(range(len(self._scopes))):
-            if name.lexeme in self._scopes[i]:
-                self.interpreter.resolve(expr, len(self._scopes) - 1 - i)
+    def _resolve_local(self, expr: Variable | Assign | This | Super, name: Token):
+        lexeme = name.lexeme
+        scopes = self._scopes
+        # walk from the innermost scope, so the index counts how far out it is
+        for distance in range(len(scopes)):
+            if lexeme in scopes[-1 - distance]:
+                # the interpreter reads the resolution straight off the node
+                expr.distance = distance
+                expr.slot = self._slots[-1 - distance][lexeme]
                 return
 
-    def _resolve_function(self, stmt: Function, _type: FunctionType):
+    def _resolve_function(self, stmt: Function, _type: int):
         enclosing_func = self.current_func
         self.current_func = _type
         self._begin_scope()
+        # the scope was just pushed, so declare and define each parameter inline
+        scope = self._scopes[-1]
+        slots = self._slots[-1]
         for param in stmt.params:
-            self._declare(param)
-            self._define(param)
+            lexeme = param.lexeme
+            if lexeme in scope:
+                self._error_and_set_flag(
+                    param,
+                    "Already a variable with this name in this scope.",
+                    show_line_number=False,
+                )
+            scope[lexeme] = True
+            # the parameters take slots 0..arity-1
+            slots.setdefault(lexeme, len(slots))
         # in static analysis, we immediately traverse into the body
         self._resolve(stmt.body.statements)
         self._end_scope()
@@ -88,9 +108,11 @@ class Resolver(ExprVisitor):
 
     def _begin_scope(self):
         self._scopes.append({})
+        self._slots.append({})
 
     def _end_scope(self):
         self._scopes.pop()
+        self._slots.pop()
 
     def _declare(self, name: Token):
         """Declaration adds the variable to the innermost scope"""
@@ -106,6 +128,9 @@ class Resolver(ExprVisitor):
                 show_line_number=False,
             )
         scope[name.lexeme] = False
+        # locals are numbered in declaration order, as the interpreter defines them
+        slots = self._slots[-1]
+        slots.setdefault(name.lexeme, len(slots))
 
     def _define(self, name: Token):
         if not self._scopes:
@@ -115,16 +140,35 @@ class Resolver(ExprVisitor):
         self._scopes[-1][name.lexeme] = True
 
     def visit_Block(self, stmt: Block):
+        # a block without declarations of its own doesn't need a scope
+        # , so the interpreter can run it in the enclosing env
+        stmt.has_scope = any(
+            type(s) is Var or type(s) is Function or type(s) is Class
+            for s in stmt.statements
+        )
+        if not stmt.has_scope:
+            self._resolve(stmt.statements)
+            return None
+
+        # until a function or class declaration shows up inside
+        stmt.captured = False
+        self._blocks.append(stmt)
         self._begin_scope()
         self._resolve(stmt.statements)
         self._end_scope()
+        self._blocks.pop()
 
         return None
 
+    def _capture_blocks(self):
+        """A function or class closes over the envs of all the blocks around it"""
+        for block in self._blocks:
+            block.captured = True
+
     def visit_Var(self, stmt: Var):
         self._declare(stmt.name)
         if stmt.initializer:
-            self._resolve(stmt.initializer)
+            self._resolve_one(stmt.initializer)
         self._define(stmt.name)
 
         return None
@@ -141,68 +185,70 @@ class Resolver(ExprVisitor):
         return None
 
     def visit_Assign(self, expr: Assign):
-        self._resolve(expr.value)
+        self._resolve_one(expr.value)
         self._resolve_local(expr, expr.name)
 
         return None
 
     def visit_Function(self, stmt: Function):
+        self._capture_blocks()
         # declare and define the name of the function in the current scope
         self._declare(stmt.name)
         self._define(stmt.name)
 
         # note that the function can recursively refer to itself
-        self._resolve_function(stmt, FunctionType.FUNCTION)
+        self._resolve_function(stmt, FT_FUNCTION)
 
         return None
 
     def visit_Expression(self, stmt: Expression):
-        self._resolve(stmt.expression)
+        self._resolve_one(stmt.expression)
 
         return None
 
     def visit_IfStmt(self, stmt: IfStmt):
         # in static analysis, there is no control flow
         # , we resolve the condition/then_branch/else_branch
-        self._resolve(stmt.condition)
-        self._resolve(stmt.then_branch)
+        self._resolve_one(stmt.condition)
+        self._resolve_one(stmt.then_branch)
         if stmt.else_branch:
-            self._resolve(stmt.else_branch)
+            self._resolve_one(stmt.else_branch)
 
         return None
 
     def visit_Print(self, stmt: Print):
-        self._resolve(stmt.expression)
+        self._resolve_one(stmt.expression)
 
         return None
 
     def visit_ReturnStmt(self, stmt: ReturnStmt):
-        if self.current_func == FunctionType.NONE:
+        if self.current_func == FT_NONE:
             self._error_and_set_flag(
                 stmt.keyword,
                 "Can't return from top-level code.",
                 show_line_number=False,
             )
         if stmt.value:
-            if self.current_func == FunctionType.INITIALIZER:
+            if self.current_func == FT_INITIALIZER:
                 self._error_and_set_flag(
                     stmt.keyword,
                     "Can't return a value from an initializer.",
                     show_line_number=False,
                 )
-            self._resolve(stmt.value)
+            self._resolve_one(stmt.value)
 
         return None
 
     def visit_WhileStmt(self, stmt: WhileStmt):
-        self._resolve(stmt.condition)
-        self._resolve(stmt.body)
+        self._resolve_one(stmt.condition)
+        self._resolve_one(stmt.body)
 
         return None
 
     def visit_Class(self, stmt: Class):
         enclosing_class = self.current_class
-        self.current_class = ClassType.CLASS
+        self.current_class = CT_CLASS
+        self._capture_blocks()
 
         self._declare(stmt.name)
         self._define(stmt.name)
@@ -218,20 +264,22 @@ class Resolver(ExprVisitor):
         # Lox allows class declarations even inside blocks
         # In that case, we need to make sure it's resloved
         if stmt.superclass:
-            self.current_class = ClassType.SUBCLASS
-            self._resolve(stmt.superclass)
+            self.current_class = CT_SUBCLASS
+            self._resolve_one(stmt.superclass)
 
         if stmt.superclass:
             self._begin_scope()
             self._scopes[-1]["super"] = True
+            self._slots[-1]["super"] = 0
 
         self._begin_scope()
         assert len(self._scopes) > 0
         self._scopes[-1]["this"] = True
+        self._slots[-1]["this"] = 0
         for method in stmt.methods.values():
-            declaration = FunctionType.METHOD
+            declaration = FT_METHOD
             if method.name.lexeme == "init":
-                declaration = FunctionType.INITIALIZER
+                declaration = FT_INITIALIZER
             self._resolve_function(method, declaration)
         self._end_scope()
 
@@ -243,32 +291,35 @@ class Resolver(ExprVisitor):
         return None
 
     def visit_Binary(self, expr: Binary):
-        self._resolve(expr.left)
-        self._resolve(expr.right)
+        self._resolve_one(expr.left)
+        self._resolve_one(expr.right)
 
         return None
 
+    # the number literal needs no resolving
+    visit_BinaryWithNumber = visit_Binary
+
     def visit_Call(self, expr: Call):
-        self._resolve(expr.callee)
+        self._resolve_one(expr.callee)
 
         for argument in expr.arguments:
-            self._resolve(argument)
+            self._resolve_one(argument)
 
         return None
 
     def visit_Get(self, expr: Get):
-        self._resolve(expr.obj)
+        self._resolve_one(expr.obj)
 
         return None
 
     def visit_Set(self, expr: Set):
-        self._resolve(expr.value)
-        self._resolve(expr.obj)
+        self._resolve_one(expr.value)
+        self._resolve_one(expr.obj)
 
         return None
 
     def visit_This(self, expr: This):
-        if self.current_class == ClassType.NONE:
+        if self.current_class == CT_NONE:
             self._error_and_set_flag(
                 expr.keyword,
                 "Can't use 'this' outside of a class.",
@@ -280,13 +331,13 @@ class Resolver(ExprVisitor):
 
     def visit_Super(self, expr: Super):
         # resolver `super` as if it were a variable
-        if self.current_class == ClassType.NONE:
+        if self.current_class == CT_NONE:
             self._error_and_set_flag(
                 expr.keyword,
                 "Can't use 'super' outside of a class.",
                 show_line_number=False,
             )
-        elif self.current_class == ClassType.CLASS:
+        elif self.current_class == CT_CLASS:
             self._error_and_set_flag(
                 expr.keyword,
                 "Can't use 'super' in a class with no superclass.",
@@ -297,7 +348,7 @@ class Resolver(ExprVisitor):
         return None
 
     def visit_Grouping(self, expr: Grouping):
-        self._resolve(expr.expression)
+        self._resolve_one(expr.expression)
 
         return None
 
@@ -306,12 +357,12 @@ class Resolver(ExprVisitor):
 
     def visit_Logical(self, expr: Logical):
         # again, we need to resolve each side
-        self._resolve(expr.left)
-        self._resolve(expr.right)
+        self._resolve_one(expr.left)
+        self._resolve_one(expr.right)
 
         return None
 
     def visit_Unary(self, expr: Unary):
-        self._resolve(expr.right)
+        self._resolve_one(expr.right)
 
         return None
@@ -1,6 +1,8 @@
-import shlex
-import subprocess
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
+from pylox import run_source
 
 # see: https://github.com/munificent/craftinginterpreters/blob/master/tool/bin/test.dart
 EXCLUDED_TESTS = [
@@ -24,6 +26,12 @@ EXCLUDED_TESTS = [
 ]
 
 
+# "// expect: ..."
+# , or "// [line ?] Error at ...", an ParseError (SyntaxError)
+# , or "// Error at ...", an InterpreterError (RuntimeError)
+_EXPECT_RE = re.compile(r"// (?:expect: (.*)|(\[line .*)|(Error at.*))")
+
+
 class Colors:
     HEADER = "\033[95m"
     OKBLUE = "\033[94m"
@@ -36,41 +44,27 @@ class Colors:
     UNDERLINE = "\033[4m"
 
 
-def extract_expect(test_case: Path) -> str:
-    """Read the test_case and extract the expected result"""
-    with open(test_case, "r") as f:
-        lines = f.readlines()
-
-    res = []
-    # for "// expect: ..."
-    for line in lines:
-        if "// expect: " in line:
-            res.append(line.split("// expect: ")[1].rstrip("\n"))
-
-    # for "[line: ?] Error at ...", an ParseError (SyntaxError)
-    if len(res) == 0:
-        for line in lines:
-            if "// [line" in line:
-                res.append(line[line.index("// [line ") :][3:].rstrip("\n"))
-
-    # for "Error at ...", an InterpreterError (RuntimeError)
-    if len(res) == 0:
-        for line in lines:
-            if "// Error at" in line:
-                res.append(line[line.index("// Error at") :][3:].rstrip("\n"))
+def extract_expect(code: str) -> str:
+    """Extract the expected result from the code of a test case"""
+    # all 3 kinds of expectations are found in a single pass
+    found: tuple[list[str], list[str], list[str]] = ([], [], [])
+    for m in _EXPECT_RE.finditer(code):
+        # the group that matched tells the kind, an expected output may be empty
+        found[m.lastindex - 1].append(m.group(m.lastindex))
+    expects, parse_errors, runtime_errors = found
 
-    return "\n".join(res)
+    # "// expect: ..." wins, then a ParseError, then an InterpreterError
+    return "\n".join(expects or parse_errors or runtime_errors)
 
 
 def run_test(test_case: Path) -> tuple[bool, str | None]:
     """Run a test located in test_case and return True if it passes the test, else return False and the error message"""
-    try:
-        output = subprocess.check_output(
-            args=shlex.split(f"python pylox.py {test_case}"), text=True
-        ).rstrip("\n")
-    except subprocess.CalledProcessError as e:
-        output = str(e.output).rstrip("\n")
-    expect = extract_expect(test_case)
+    # read the file once, for both running it and finding what it expects
+    with open(test_case, "r") as f:
+        code = f.read()
+    # in this process, without paying for a new interpreter per test
+    output = run_source(code).rstrip("\n")
+    expect = extract_expect(code)
 
     if output == expect:
         return True, None
@@ -81,38 +75,50 @@ def run_test(test_case: Path) -> tuple[bool, str | None]:
         return False, "\n".join(err)
 
 
-def run_all_tests(test_folder: Path):
+def run_all_tests(test_folder: str, executor: Executor):
     """Run all tests in this folder and return the stats of PASS/SKIP/FAIL"""
     PASS, SKIP, FAIL = 0, 0, 0
-    for test_case in sorted(test_folder.iterdir()):
-        if test_case.suffix == ".lox":
-            if str(test_case.relative_to(".")) in EXCLUDED_TESTS:
-                print(f"{Colors.OKBLUE}[SKIP]{Colors.ENDC} {test_case}")
-                SKIP += 1
+    # a DirEntry carries its name, so filtering needs no Path per file
+    test_cases = sorted(
+        entry.path for entry in os.scandir(test_folder) if entry.name.endswith(".lox")
+    )
+    # hand all the tests to the workers at once, and collect the results in order
+    results = {
+        test_case: executor.submit(run_test, Path(test_case))
+        for test_case in test_cases
+        if test_case not in EXCLUDED_TESTS
+    }
+    for test_case in test_cases:
+        if test_case not in results:
+            print(f"{Colors.OKBLUE}[SKIP]{Colors.ENDC} {test_case}")
+            SKIP += 1
+        else:
+            status, msg = results[test_case].result()
+            if status:
+                print(f"{Colors.OKGREEN}[PASS]{Colors.ENDC} {test_case}")
+                PASS += 1
             else:
-                status, msg = run_test(test_case)
-                if status:
-                    print(f"{Colors.OKGREEN}[PASS]{Colors.ENDC} {test_case}")
-                    PASS += 1
-                else:
-                    print(f"{Colors.FAIL}[FAIL]{Colors.ENDC} {test_case}")
-                    print(msg)
-                    FAIL += 1
+                print(f"{Colors.FAIL}[FAIL]{Colors.ENDC} {test_case}")
+                print(msg)
+                FAIL += 1
 
     return PASS, SKIP, FAIL
 
 
 def test_runner(tests: str):
     PASS, SKIP, FAIL = 0, 0, 0
-    for test_topic in Path(tests).iterdir():
-        # NOTE: disable benchmark because it's too slow
-        if test_topic.is_dir() and test_topic.stem not in ["benchmark", "limit"]:
-            print(f"------ {test_topic} ------")
-            x, y, z = run_all_tests(test_topic)
-            PASS += x
-            SKIP += y
-            FAIL += z
-            print("--------------------------")
+    # a test redirects sys.stdout while it runs, so the workers are processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # normalized, so the paths match EXCLUDED_TESTS, e.g. "./tests" -> "tests"
+        for test_topic in os.scandir(os.path.normpath(tests)):
+            # NOTE: disable benchmark because it's too slow
+            if test_topic.is_dir() and test_topic.name not in ["benchmark", "limit"]:
+                print(f"------ {test_topic.path} ------")
+                x, y, z = run_all_tests(test_topic.path, executor)
+                PASS += x
+                SKIP += y
+                FAIL += z
+                print("--------------------------")
     print("--------- Summary ----------")
     print(
         f"  [PASS]: {PASS: >3} / {(PASS + SKIP + FAIL)} -- {PASS / (PASS + SKIP + FAIL):.2%}"
@@ -1,6 +1,17 @@
-from typing import Any
+import re
+import sys
+from string import ascii_letters, digits
+from typing import Any, Callable
 from tokens import Token, TokenType
 
+# the rest of an identifier/number after its first char
+# , so the regex engine consumes it instead of a Python loop over the chars
+_IDENTIFIER_REST = re.compile(r"[a-zA-Z0-9_]*")
+# a fractional part needs a digit after the ".", otherwise the "." is left alone
+_NUMBER_REST = re.compile(r"[0-9]*(?:\.[0-9]+)?")
+# newlines are left out, they are counted one by one
+_WHITESPACE_REST = re.compile(r"[ \r\t]*")
+
 
 class Scanner:
     keywords = {
@@ -23,6 +34,10 @@ class Scanner:
     }
 
     def __init__(self, source: str):
+        self.reset(source)
+
+    def reset(self, source: str):
+        """Start over on new source, so the REPL can keep one scanner for every line"""
         self._source = source
         self._tokens: list[Token] = []
         # invariant:
@@ -35,15 +50,6 @@ class Scanner:
 
         self.has_error = False
 
-    def is_at_end(self):
-        return self._current >= len(self._source)
-
-    def _advance(self) -> str:
-        """Consume the next char and return"""
-        val = self._source[self._current]
-        self._current += 1
-        return val
-
     def _add_token(self, token_type: TokenType, literal: Any = ""):
         """There is no method overloading in Python"""
         self._tokens.append(
@@ -57,153 +63,150 @@ class Scanner:
 
     def _match(self, ch: str) -> bool:
         """Only consume the current char if it's what we are looking for"""
-        if self.is_at_end():
-            return False
-        if self._source[self._current] != ch:
-            return False
-
-        self._current += 1
-        return True
-
-    def _peek(self) -> str:
-        """Similar to `self._match` function but won't consume chars"""
-        if self.is_at_end():
-            return "\0"
-
-        return self._source[self._current]
+        # startswith is simply False at the end, no separate bounds check needed
+        if self._source.startswith(ch, self._current):
+            self._current += 1
+            return True
 
-    def _peek_next(self) -> str:
-        """Don't consume the . in a number literal until we're sure there is a digit after it"""
-        if self._current + 1 >= len(self._source):
-            return "\0"
-
-        return self._source[self._current + 1]
-
-    def _is_digit(self, ch: str) -> bool:
-        return "0" <= ch <= "9"
-
-    def _is_alpha(self, ch: str) -> bool:
-        return "a" <= ch <= "z" or "A" <= ch <= "Z" or ch == "_"
-
-    def _is_alpha_numeric(self, ch: str) -> bool:
-        return self._is_digit(ch) or self._is_alpha(ch)
+        return False
 
     def _form_string(self):
-        while self._peek() != '"' and not self.is_at_end():
-            # a string literal is "..."
-            if self._peek() == "\n":
-                self._line += 1
-            self._advance()
-
-        if self.is_at_end():
+        # a string literal is "...", find the closing " in one go
+        source = self._source
+        end = source.find('"', self._current)
+        if end == -1:
+            # report the error on the last line, as if scanned to the end char by char
+            self._line += source.count("\n", self._current)
+            self._current = len(source)
             self.has_error = True
             print(f"[line {self._line}] Error: Unterminated string.")
             return
 
+        # a string literal may span multiple lines
+        self._line += source.count("\n", self._current, end)
         # consume the closing "
-        self._advance()
+        self._current = end + 1
 
-        # note: [self._start + 1:self._current - 1] will chose string INSIDE "..."
-        self._add_token(
-            TokenType.STRING, self._source[self._start + 1 : self._current - 1]
-        )
+        # note: [self._start + 1:end] will chose string INSIDE "..."
+        self._add_token(TokenType.STRING, source[self._start + 1 : end])
 
     def _form_number(self):
-        while self._is_digit(self._peek()):
-            self._advance()
-        if self._peek() == "." and self._is_digit(self._peek_next()):
-            # consume the . in a number literal
-            self._advance()
-            # consume the fractional part
-            while self._is_digit(self._peek()):
-                self._advance()
-
-        self._add_token(
-            TokenType.NUMBER, float(self._source[self._start : self._current])
-        )
-
-    def _form_identifier(self):
-        while self._is_alpha_numeric(self._peek()):
-            self._advance()
+        self._current = _NUMBER_REST.match(self._source, self._current).end()
 
+        # slice the lexeme once, for both the token and its value
         text = self._source[self._start : self._current]
-        if text in Scanner.keywords:
-            self._add_token(Scanner.keywords[text])
+        self._tokens.append(Token(TokenType.NUMBER, text, float(text), self._line))
+
+    def _form_identifier(self):
+        self._current = _IDENTIFIER_REST.match(self._source, self._current).end()
+
+        # intern it so that the same name always shares one str object
+        # , which makes the dict lookups keyed by this name cheaper
+        text = sys.intern(self._source[self._start : self._current])
+        # a single probe, and the hash was already computed by sys.intern
+        token_type = Scanner.keywords.get(text, TokenType.IDENTIFIER)
+        self._tokens.append(Token(token_type, text, "", self._line))
+
+    def _form_slash(self):
+        source = self._source
+        if source.startswith("/", self._current):
+            # a comment goes until the end of the line
+            # , jump right before the "\n" so that _newline still counts it
+            end = source.find("\n", self._current + 1)
+            self._current = len(source) if end == -1 else end
         else:
-            self._add_token(TokenType.IDENTIFIER)
-
-    def _scan_token(self):
-        c = self._advance()
-        match c:
-            # a lexeme whose length is one
-            case "(":
-                self._add_token(TokenType.LEFT_PAREN)
-            case ")":
-                self._add_token(TokenType.RIGHT_PAREN)
-            case "{":
-                self._add_token(TokenType.LEFT_BRACE)
-            case "}":
-                self._add_token(TokenType.RIGHT_BRACE)
-            case ",":
-                self._add_token(TokenType.COMMA)
-            case ".":
-                self._add_token(TokenType.DOT)
-            case "-":
-                self._add_token(TokenType.MINUS)
-            case "+":
-                self._add_token(TokenType.PLUS)
-            case ";":
-                self._add_token(TokenType.SEMICOLON)
-            case "*":
-                self._add_token(TokenType.STAR)
-            # a lexeme whose length is two
-            case "!":
-                self._add_token(
-                    TokenType.BANG_EQUAL if self._match("=") else TokenType.BANG
-                )
-            case "=":
-                self._add_token(
-                    TokenType.EQUAL_EQUAL if self._match("=") else TokenType.EQUAL
-                )
-            case "<":
-                self._add_token(
-                    TokenType.LESS_EQUAL if self._match("=") else TokenType.LESS
-                )
-            case ">":
-                self._add_token(
-                    TokenType.GREATER_EQUAL if self._match("=") else TokenType.GREATER
-                )
-            case "/":
-                if self._match("/"):
-                    # a comment goes until the end of the line
-                    # keep consume chars until we reach the end of the line
-                    while self._peek() != "\n" and not self.is_at_end():
-                        self._advance()
-                else:
-                    self._add_token(TokenType.SLASH)
-            case " " | "\r" | "\t":
-                # ignore whitespaces
-                ...
-            case "\n":
-                self._line += 1
-            case ch if self._is_digit(ch):
-                self._form_number()
-            case ch if self._is_alpha(ch):
-                self._form_identifier()
-            case '"':
-                # string literals
-                self._form_string()
-            case _:
-                self.has_error = True
-                print(f"[line {self._line}] Error : Unexpected character.")
+            self._tokens.append(Token(TokenType.SLASH, "/", "", self._line))
+
+    def _newline(self):
+        self._line += 1
+
+    def _whitespace(self):
+        # ignore whitespaces, the whole run at once
+        self._current = _WHITESPACE_REST.match(self._source, self._current).end()
+
+    def _unexpected(self):
+        self.has_error = True
+        print(f"[line {self._line}] Error : Unexpected character.")
 
     def scan_tokens(self):
-        while not self.is_at_end():
+        # hoist the lookups out of the loop, which runs once per lexeme
+        source = self._source
+        length = len(source)
+        rules = _SCAN_RULES
+        unexpected = Scanner._unexpected
+        while self._current < length:
             # invariant: in each loop
             # , we are at the beginning of the next lexeme
-            self._start = self._current
-            self._scan_token()
+            self._start = current = self._current
+            self._current = current + 1
+            # one lookup on the first char instead of trying the cases in turn
+            rules.get(source[current], unexpected)(self)
 
         self._tokens.append(Token(TokenType.EOF, None, "", self._line))
 
         return self._tokens
+
+
+def _one_char(lexeme: str, token_type: TokenType) -> Callable[[Scanner], None]:
+    """A lexeme whose length is one"""
+    # the lexeme is always the same, so there is nothing to slice from the source
+    return lambda scanner: scanner._tokens.append(
+        Token(token_type, lexeme, "", scanner._line)
+    )
+
+
+def _one_or_two_chars(
+    lexeme: str, token_type: TokenType, with_equal: TokenType
+) -> Callable[[Scanner], None]:
+    """A lexeme whose length is two if the next char is =, e.g. ! and !="""
+    lexeme_with_equal = lexeme + "="
+
+    def rule(scanner: Scanner):
+        if scanner._match("="):
+            scanner._tokens.append(
+                Token(with_equal, lexeme_with_equal, "", scanner._line)
+            )
+        else:
+            scanner._tokens.append(Token(token_type, lexeme, "", scanner._line))
+
+    return rule
+
+
+# { char: the type of the one-char lexeme }
+_ONE_CHAR_TOKENS = {
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "*": TokenType.STAR,
+}
+# { char: (the type of the lexeme, the type when it's followed by =) }
+_ONE_OR_TWO_CHAR_TOKENS = {
+    "!": (TokenType.BANG, TokenType.BANG_EQUAL),
+    "=": (TokenType.EQUAL, TokenType.EQUAL_EQUAL),
+    "<": (TokenType.LESS, TokenType.LESS_EQUAL),
+    ">": (TokenType.GREATER, TokenType.GREATER_EQUAL),
+}
+
+# { the first char of a lexeme: how to scan the rest of it }
+_SCAN_RULES: dict[str, Callable[[Scanner], None]] = {
+    "/": Scanner._form_slash,
+    " ": Scanner._whitespace,
+    "\r": Scanner._whitespace,
+    "\t": Scanner._whitespace,
+    "\n": Scanner._newline,
+    '"': Scanner._form_string,
+}
+for ch, token_type in _ONE_CHAR_TOKENS.items():
+    _SCAN_RULES[ch] = _one_char(ch, token_type)
+for ch, (token_type, with_equal) in _ONE_OR_TWO_CHAR_TOKENS.items():
+    _SCAN_RULES[ch] = _one_or_two_chars(ch, token_type, with_equal)
+for ch in digits:
+    _SCAN_RULES[ch] = Scanner._form_number
+for ch in ascii_letters + "_":
+    _SCAN_RULES[ch] = Scanner._form_identifier
@@ -1,10 +1,11 @@
-from enum import Enum
+from enum import IntEnum
 from typing import Any
 from dataclasses import dataclass
 
 
 # see: https://stackoverflow.com/questions/36932/how-can-i-represent-an-enum-in-python
-class TokenType(Enum):
+# , an IntEnum so that hashing and comparing the members run in C
+class TokenType(IntEnum):
     # single-char tokens.
     LEFT_PAREN = 1
     RIGHT_PAREN = 2
@@ -51,7 +52,8 @@ class TokenType(Enum):
 
 
 # the Token class is barely a dataclass
-@dataclass(frozen=False)
+# , and tokens are read all over the interpreter, so give them __slots__ too
+@dataclass(frozen=False, slots=True)
 class Token:
     type: TokenType
     lexeme: str
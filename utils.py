@@ -1,4 +1,12 @@
-from functools import wraps
+from functools import partial
+
+
+class _NativeFunction(partial):
+    """A built-in function with an arity. partial calls it from C
+    , so unlike a Python wrapper, there is no extra frame per call
+    """
+
+    arity: int
 
 
 def set_arity(arity: int):
@@ -7,12 +15,14 @@ def set_arity(arity: int):
     """
 
     def decorated(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
-
-        wrapper.arity = arity
-        return wrapper
+        try:
+            # a Python function takes the attribute as it is
+            func.arity = arity
+            return func
+        except AttributeError:
+            native = _NativeFunction(func)
+            native.arity = arity
+            return native
 
     return decorated
 